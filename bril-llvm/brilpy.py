@@ -2,8 +2,15 @@
 
 # Mark Moeller:
 
+import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'examples'))
+import cfg  # noqa: E402
+import traverse  # noqa: E402
+import worklist  # noqa: E402
+
 TERM = 'jmp', 'br', 'ret'
 
 
@@ -35,70 +42,18 @@ class CFG:
     # names: a list of block names
     # blocks: the list of blocks themselves
     # edges: idx->idx map of successors
+    # The graph itself comes from the shared CFG in examples/cfg.py; blocks
+    # here keep their labels and are not given explicit terminators.
     def __init__(self, func):
-        self.names = []
-        self.blocks = []
-
-        # Map label -> block idx for that label
-        labels = {}
-
-        # Edges of the CFG
-        self.edges = []
-
-        # When we encounter jumps to labels that haven't appeared yet, add the
-        # label here with a list of blocks that need to jump TO that label
-        # label -> [list of blocks forward-jumping to it]
-        resolve = {}
-
-        def make_edge(idx, label):
-            if label in labels:
-                self.edges[idx].append(labels[label])
-            else:
-                if label in resolve:
-                    resolve[label].append(idx)
-                else:
-                    resolve[label] = [idx]
-
-        for i, block in enumerate(form_blocks(func['instrs'])):
-
-            self.blocks.append(block)
-            self.edges.append([])
-
-            name = "b" + str(i)
-
-            if 'label' in block[0]:
-                name = block[0]['label']
-                labels[name] = i
-
-            self.names.append(name)
-
-            if 'op' in block[-1] and (block[-1]['op'] == 'br' or
-                                      block[-1]['op'] == 'jmp'):
-                for label in block[-1]['labels']:
-                    make_edge(i, label)
-
-            elif 'op' in block[-1] and block[-1]['op'] != 'ret':
-                self.edges[i] = [i+1]
+        graph = cfg.CFG(func['instrs'])
 
+        self.names = [b.name for b in graph.blocks]
+        self.blocks = [([b.label] if b.label else []) + b.instrs
+                       for b in graph.blocks]
+        self.edges = graph.succs
+        self.preds = graph.preds
         self.n = len(self.names)
 
-        for lab, idcs in resolve.items():
-            for idx in idcs:
-                self.edges[idx].append(labels[lab])
-
-        # If we added i+1 for the last block, remove it (there is no successor)
-        if self.n in self.edges[-1]:
-            self.edges[-1] = []
-
-        # compute edges_r to get predecessors
-        self.preds = []
-        for i in range(self.n):
-            self.preds.append([])
-
-        for k, v in enumerate(self.edges):
-            for d in v:
-                self.preds[d].append(k)
-
     # perform a dfs in the specified order, calling pre(i) and post(i) upon
     # previsit and posvisit of i, respectively.
     # next_tree is called with no args after each time dfs_visit finishes a
@@ -111,38 +66,17 @@ class CFG:
         if not edges:
             edges = self.edges
 
-        WHITE = 0
-        GRAY = 1
-        BLACK = 2
-
-        colors = [WHITE] * self.n
-
-        def dfs_visit(node):
-            if colors[node] == WHITE:
-                colors[node] = GRAY
-                if pre:
-                    pre(node)
-                for v in edges[node]:
-                    dfs_visit(v)
-                colors[node] = BLACK
-                if post:
-                    post(node)
-
+        # The traversal keeps its own stack (examples/traverse.py), so deep
+        # CFGs don't hit the recursion limit.
+        seen = set()
         for i in order:
-            dfs_visit(i)
+            traverse.dfs(edges, [i], pre, post, seen)
             if next_tree:
                 next_tree()
 
     # Return the indices in reverse-post-order.
     def rpo(self):
-        visited = []
-
-        def post_visit(i):
-            visited.append(i)
-
-        self.dfs(post=post_visit)
-        visited.reverse()
-        return visited
+        return traverse.reverse_postorder(self.edges, range(self.n))
 
     # Unused first attempt. Computes SCCs in the graph.
     def natural_loops(self):
@@ -261,26 +195,26 @@ def rd_merge(pred_list):
 # xfer: (in_b, block) -> out_b:         Compute transfer for a single block.
 # merge: List of out_b -> in_b:         Given a list of predecessors' out_b's,
 #                                       compute a single in_b.
+# stats: Counter, optional:             Receives the solver's iteration counts
+#                                       (see examples/worklist.py).
 # ------------------------------------------------------------------------------
 
-def run_worklist(func, init, xfer, merge):
+def run_worklist(func, init, xfer, merge, stats=None):
     graph = CFG(func)
 
     (in_b, out_b) = init(func, graph)
 
-    worklist = list(range(graph.n))
-
-    while worklist:
-        b = worklist[0]
-        worklist = worklist[1:]
-
+    def visit(b):
         in_b[b] = merge([out_b[x] for x in graph.preds[b]]) if graph.preds[b] else {}
 
-        out_b_copy = out_b[b].copy()
+        out_b_copy = out_b[b]
 
         out_b[b] = xfer(in_b[b], graph.blocks[b], b)
 
-        if out_b[b] != out_b_copy:
-            worklist += graph.edges[b]
+        return out_b[b] != out_b_copy
+
+    # Visit the blocks in reverse postorder, starting from the entry.
+    order = traverse.reverse_postorder(graph.edges, range(graph.n))
+    worklist.iterate(order, graph.edges, visit, stats)
 
     return (in_b, out_b)
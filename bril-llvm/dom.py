@@ -3,86 +3,41 @@
 import sys
 import json
 from brilpy import *
-from functools import reduce
+import dominance  # examples/, on the path via brilpy
+import functools
 
 class Dominators:
 
-    def __init__(self, func):
-        g = CFG(func)
-
-        # First compute dominators
-        # IMPORTANT: This computes, for each block, the set of blocks that dominate
-        # it, not the other way around
-        self.doms = []
-        self.doms.append(set([0])) # Entry block is special, it's its own dominator
-        for i in range(1,g.n):
-            self.doms.append(set(range(g.n)))
-
-        order = g.rpo()
-
-        changed = True
-        while changed:
-            changed = False
-            for i in order[1:]: # no one can dominate 0 except 0
-                d = {i}
-                if g.preds[i]:
-                    d |= reduce(set.intersection, [self.doms[p] for p in g.preds[i]], set(range(g.n)))
-
-                if d != self.doms[i]:
-                    changed = True
-                    self.doms[i] = d
-
-        # Compute the "other way around" (from above), that is, for each block, the
-        # set of blocks this block dominates
-        self.dom_by = []
-        for i in range(g.n):
-            self.dom_by.append(set())
-
-        for i,d in enumerate(self.doms):
-            for mbr in d:
-                self.dom_by[mbr].add(i)
-
-
-
-        # Compute the dominance tree
-        dt_parent = [None]
-
-        for i in range(1, g.n):
-            for j in self.doms[i]:
-                if i != j:  # j strictly dominates i
-                    immed_dom = True
-                    for k in range(g.n):
-                        if k != j and k != i and j in self.doms[k] and k in self.doms[i]:
-                            immed_dom = False
-                            break
-                    if immed_dom:
-                        dt_parent.append(j)
-                        break
-
-        self.dom_tree = {}
-        for i,p in enumerate(dt_parent):
-            if p in self.dom_tree:
-                self.dom_tree[p].append(i)
-            else:
-                self.dom_tree[p] = [i]
+    # Pass the function's CFG as g if the caller already has one.
+    # The immediate dominators come from examples/dominance.py, using the
+    # given engine ('auto', 'chk', or 'lt'); everything else is derived from
+    # them.
+    def __init__(self, func, g=None, engine='auto'):
+        g = g or CFG(func)
+        self.n = g.n
+        self.dominance = dominance.Dominance(g.edges, g.preds, 0, engine)
+
+        # Compute the dominance tree, as a map from each block to its
+        # children in block order (the entry is the child of None). ssa.py
+        # renames the children in this order.
+        self.dom_tree = {None: [0]}
+        for i, children in enumerate(self.dominance.children()):
+            if children:
+                self.dom_tree[i] = sorted(children)
 
         # Compute dominance frontier
-        self.frontier = []
-        for i in range(g.n):
-            self.frontier.append(set())
-
-        for i,d in enumerate(self.doms):
-            # Union of dominators for this node's preds
-            pre_doms = reduce(set.union, [self.doms[p] for p in g.preds[i]], set())
-            # Subtract out strict dominators for this node
-            pre_doms = pre_doms.difference(self.doms[i].difference(set([i])))
-
-            # This node is in the frontier for the remaining nodes:
-            for p in pre_doms:
-                self.frontier[p].add(i)
-
+        self.frontier = self.dominance.frontiers()
 
+    # For each block, the set of blocks that dominate it (not the other way
+    # around). Unreachable blocks have none.
+    @functools.cached_property
+    def doms(self):
+        return [set(self.dominance.dominators(i)) for i in range(self.n)]
 
+    # For each block, the set of blocks it dominates.
+    @functools.cached_property
+    def dom_by(self):
+        return [set(self.dominance.dominated(i)) for i in range(self.n)]
 
 
 def main():
@@ -103,10 +58,10 @@ def main():
         print("  edges: {}".format(g.edges))
         print("  preds: {}".format(g.preds))
 
-        d = dominators(func)
+        d = Dominators(func, g)
 
         print("\n\n  doms:\n{}\n".format(d.doms))
-        for k,v in enumerate(doms):
+        for k,v in enumerate(d.doms):
             print("    {}: ".format(g.names[k]), end="")
             for mbr in v:
                 print("{} ".format(g.names[mbr]), end="")
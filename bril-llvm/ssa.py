@@ -4,11 +4,18 @@ import sys
 import json
 from dom import Dominators
 from brilpy import *
+import cfg  # examples/, on the path via brilpy
+import df
+import traverse
 from functools import reduce
 
 TERM = 'jmp', 'br', 'ret'
 
-def to_ssa(prog):
+# mode: which phis to insert. 'minimal' puts one at every join point in the
+# iterated dominance frontier of a variable's definitions; 'semi-pruned' only
+# does that for variables that some block reads before assigning, and
+# 'pruned' only where the variable is live.
+def to_ssa(prog, mode='minimal'):
     for func in prog['functions']:
 
         # Add dummy id operations for each argument.
@@ -59,7 +66,7 @@ def to_ssa(prog):
 
         g = CFG(func)
 
-        domins = Dominators(func)
+        domins = Dominators(func, g)
 
         defs = {}
         for i,b in enumerate(g.blocks):
@@ -82,14 +89,29 @@ def to_ssa(prog):
 
         # Following pseudocode from Lesson 5 notes
         # ``Step one''
+        # Variables read in some block before they are assigned there (the
+        # only ones that can need a phi), and the variables live into each
+        # block (from examples/df.py, on the same blocks).
+        if mode == 'semi-pruned':
+            needed = set()
+            for b in g.blocks:
+                assigned = set()
+                for instr in b:
+                    needed.update(a for a in instr.get('args', []) if a not in assigned)
+                    if 'dest' in instr:
+                        assigned.add(instr['dest'])
+        if mode == 'pruned':
+            live_in, _ = df.solve(cfg.CFG(func['instrs']), df.ANALYSES['live'])
+
+        # Each variable gets a phi in every block of the iterated dominance
+        # frontier of its definitions.
         for v,vdefs in defs.items():
-            for d in vdefs:
-                for b in domins.frontier[d]:
-                    if v not in phis[b]:
-                        phis[b][v] = {'op':'phi', 'args':[], 'labels':[]} # will handle dest/args later
-
-                    if b not in defs[v]:
-                        defs[v].append(b)
+            if mode == 'semi-pruned' and v not in needed:
+                continue
+            for b in domins.dominance.iterated_frontier(vdefs):
+                if mode == 'pruned' and v not in live_in[g.names[b]]:
+                    continue
+                phis[b][v] = {'op':'phi', 'args':[], 'labels':[]} # will handle dest/args later
 
         # ``Step two''
         stack = {}
@@ -110,12 +132,17 @@ def to_ssa(prog):
             stack[ogvar].append(n)
             return n
 
+        # map from vars to count of names pushed (so we can pop them), for
+        # each block on the current path down the dominator tree
+        push_counts = []
+
         # b: index of block
         def rename(b):
 
 
             # map from vars to count of names pushed (so we can pop them)
             push_count = {}
+            push_counts.append(push_count)
 
             for v,p in phis[b].items():
                 p['dest'] = new_name(v)
@@ -156,16 +183,17 @@ def to_ssa(prog):
                         phis[s][v]['args'].append(stack[v][-1])
                         phis[s][v]['labels'].append(g.names[b])
 
-            if b in domins.dom_tree:
-                for b_dom in domins.dom_tree[b]:
-                    rename(b_dom)
-
+        # b: index of block, after all the blocks it dominates
+        def pop_names(b):
             # pop all the names
-            for var,count in push_count.items():
+            for var,count in push_counts.pop().items():
                 for j in range(count):
                     stack[var].pop()
 
-        rename(0)
+        # Walk the dominator tree with an explicit stack, since deep CFGs
+        # would hit the recursion limit.
+        traverse.walk_tree(0, lambda b: domins.dom_tree.get(b, ()), rename,
+                           pop_names)
 
 
         # Add labels to blocks missing labels, and add jumps to blocks that fall
@@ -27,6 +27,13 @@ export type Type = PrimType | ParamType;
  */
 export type Position = {row: number, col: number};
 
+/**
+ * A compact alternative to `pos` fields on a function's instructions: the
+ * position of `instrs[i]` is `row[i]` and `col[i]`, where a row of 0 means
+ * the instruction has no position.
+ */
+export type PositionTable = {row: number[], col: number[]};
+
 /**
  * Common fields in any operation.
  */
@@ -136,6 +143,7 @@ export interface Function {
   instrs: (Instruction | Label)[];
   type?: Type;
   pos?: Position;
+  positions?: PositionTable;
 }
 
 /**
@@ -0,0 +1,201 @@
+"""Throughput benchmarks for the Bril text format tools.
+
+Usage:
+
+    python3 bench.py {parse,print,parallel} [FILE ...]
+
+With no files, the benchmark runs over the whole `benchmarks/` corpus.
+Each mode times the current implementation against the implementation
+it replaced and reports instructions per second for both.
+"""
+
+import contextlib
+import functools
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+import lark
+
+import briltxt
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      '..', 'benchmarks', '**', '*.bril')
+
+
+def count_instrs(prog):
+    """Count the instructions (not labels) in a Bril program.
+    """
+    return sum(1 for func in prog['functions']
+               for instr in func['instrs'] if 'op' in instr)
+
+
+def parse_earley(txt):
+    """The original parser: build an Earley parser from scratch for
+    every program.
+    """
+    parser = lark.Lark(briltxt.GRAMMAR, maybe_placeholders=True)
+    return briltxt.JSONTransformer().transform(parser.parse(txt))
+
+
+@functools.lru_cache(maxsize=None)
+def _tree_parser():
+    return briltxt._make_parser()
+
+
+def parse_tree(txt):
+    """The cached LALR parser, building a parse tree and transforming it
+    in a second pass.
+    """
+    return briltxt.JSONTransformer().transform(_tree_parser().parse(txt))
+
+
+def parse_inline(txt):
+    """The cached LALR parser, transforming inline with no parse tree.
+    """
+    return briltxt.parse_prog(txt)
+
+
+def legacy_instr_to_string(instr):
+    """The original `str.format`-based instruction formatter.
+    """
+    if instr['op'] == 'const':
+        tyann = ': {}'.format(briltxt.type_to_str(instr['type'])) \
+            if 'type' in instr else ''
+        return '{}{} = const {}'.format(
+            instr['dest'], tyann, str(instr['value']).lower(),
+        )
+    rhs = instr['op']
+    if instr.get('funcs'):
+        rhs += ' {}'.format(' '.join(
+            '@{}'.format(f) for f in instr['funcs']
+        ))
+    if instr.get('args'):
+        rhs += ' {}'.format(' '.join(instr['args']))
+    if instr.get('labels'):
+        rhs += ' {}'.format(' '.join(
+            '.{}'.format(f) for f in instr['labels']
+        ))
+    if 'dest' in instr:
+        tyann = ': {}'.format(briltxt.type_to_str(instr['type'])) \
+            if 'type' in instr else ''
+        return '{}{} = {}'.format(instr['dest'], tyann, rhs)
+    return rhs
+
+
+def print_legacy(txt, out):
+    """The original printer: load the whole program, then `print()`
+    every line separately.
+    """
+    with contextlib.redirect_stdout(out):
+        for func in json.loads(txt)['functions']:
+            typ = func.get('type', 'void')
+            print('@{}{}{} {{'.format(
+                func['name'],
+                briltxt.args_to_string(func.get('args', [])),
+                ': {}'.format(briltxt.type_to_str(typ))
+                if typ != 'void' else '',
+            ))
+            for instr in func['instrs']:
+                if 'label' in instr:
+                    print('.{}:'.format(instr['label']))
+                else:
+                    print('  {};'.format(legacy_instr_to_string(instr)))
+            print('}')
+
+
+def print_streaming(txt, out):
+    """The buffered printer, reading the JSON one function at a time.
+    """
+    briltxt.write_funcs(briltxt.iter_json_funcs(io.StringIO(txt)), out)
+
+
+def timed(func, sources, repeat):
+    """Run `func` on every source text `repeat` times and return the
+    best total time over all sources.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for txt in sources:
+            func(txt)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(name, ninstrs, elapsed, baseline=None):
+    line = '{:<10} {:>10.3f} s {:>12.0f} instrs/s'.format(
+        name, elapsed, ninstrs / elapsed,
+    )
+    if baseline is not None:
+        line += '  ({:.1f}x)'.format(baseline / elapsed)
+    print(line)
+
+
+def bench_parse(sources, repeat=3):
+    ninstrs = sum(count_instrs(parse_inline(txt)) for txt in sources)
+    print('{} programs, {} instructions'.format(len(sources), ninstrs))
+
+    before = timed(parse_earley, sources, repeat)
+    report('earley', ninstrs, before)
+    for name, func in (('lalr-tree', parse_tree), ('lalr', parse_inline)):
+        report(name, ninstrs, timed(func, sources, repeat), before)
+
+
+def bench_print(sources, repeat=3):
+    progs = [parse_inline(txt) for txt in sources]
+    ninstrs = sum(count_instrs(prog) for prog in progs)
+    print('{} programs, {} instructions'.format(len(sources), ninstrs))
+
+    # Print the JSON for every program to a real (buffered) file.
+    texts = [json.dumps(prog, indent=2, sort_keys=True) for prog in progs]
+    with open(os.devnull, 'w') as out:
+        before = timed(lambda txt: print_legacy(txt, out), texts, repeat)
+        report('print', ninstrs, before)
+        after = timed(lambda txt: print_streaming(txt, out), texts, repeat)
+        report('buffered', ninstrs, after, before)
+
+
+def bench_parallel(sources, repeat=3):
+    """Parse each program serially and with a worker pool per CPU. This
+    pays off on large, many-function programs, not the small corpus.
+    """
+    ninstrs = sum(count_instrs(parse_inline(txt)) for txt in sources)
+    print('{} programs, {} instructions, {} CPUs'.format(
+        len(sources), ninstrs, os.cpu_count(),
+    ))
+
+    before = timed(parse_inline, sources, repeat)
+    report('serial', ninstrs, before)
+    after = timed(briltxt.parse_prog_parallel, sources, repeat)
+    report('parallel', ninstrs, after, before)
+
+
+MODES = {
+    'parse': bench_parse,
+    'print': bench_print,
+    'parallel': bench_parallel,
+}
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in MODES:
+        print('usage: {} {{{}}} [FILE ...]'.format(
+            sys.argv[0], ','.join(MODES),
+        ), file=sys.stderr)
+        sys.exit(1)
+
+    files = sys.argv[2:] or sorted(glob.glob(CORPUS, recursive=True))
+    sources = []
+    for fn in files:
+        with open(fn) as f:
+            sources.append(f.read())
+    MODES[sys.argv[1]](sources)
+
+
+if __name__ == '__main__':
+    main()
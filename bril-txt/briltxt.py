@@ -5,11 +5,23 @@ human-editable representation of Bril programs. There are two commands:
 `bril2txt`, which takes a Bril program in its (canonical) JSON format and
 pretty-prints it in the text format, and `bril2json`, which parses the
 format and emits the ordinary JSON representation.
+
+It also defines a compact binary encoding of Bril programs, which is
+cheaper to load and store than JSON, with the `json2bin` and `bin2json`
+commands to convert to and from it.
 """
 
 import lark
 import sys
 import json
+import functools
+import collections
+import array
+import mmap
+import struct
+import os
+import re
+import concurrent.futures
 
 __version__ = '0.0.1'
 
@@ -22,7 +34,7 @@ start: (struct | func)*
 struct: STRUCT IDENT "=" "{" mbr* "}"
 mbr: IDENT ":" type ";"
 
-func: FUNC ["(" arg_list? ")"] [tyann] "{" instr* "}"
+func: FUNC ["(" arg_list ")"] [tyann] "{" instr* "}"
 arg_list: | arg ("," arg)*
 arg: IDENT ":" type
 ?instr: const | vop | eop | label
@@ -62,17 +74,74 @@ COMMENT: /#.*/
 """.strip()
 
 
+# Pass as `include_pos` to record the positions of a function's
+# instructions in one table instead of a `pos` dict on each of them.
+POS_TABLE = 'table'
+
+
 def _pos(token):
     """Generate a position dict from a Lark token."""
     return {'row': token.line, 'col': token.column}
 
 
+def instr_pos(func, idx):
+    """Get the source position of the instruction or label at index
+    `idx` in a function, or None if it has none.
+
+    The position comes from the function's position table if it has
+    one, or else from the instruction's own `pos` field.
+    """
+    table = func.get('positions')
+    if table is None:
+        return func['instrs'][idx].get('pos')
+    row = table['row'][idx]
+    if not row:
+        return None
+    return {'row': row, 'col': table['col'][idx]}
+
+
 class JSONTransformer(lark.Transformer):
-    def __init__(self, include_pos=False):
+    """Turn the text format's syntax into Bril JSON data.
+
+    The transformer can either run over a finished parse tree or be
+    handed to the parser, which then applies it inline without building
+    a tree. If `emit` is given, each top-level struct and function is
+    passed to it as soon as it is complete instead of being collected
+    into the result of `start`.
+
+    With `include_pos=POS_TABLE`, instruction and label positions are
+    collected as they are transformed (in source order) and attached to
+    their function as a `positions` table of parallel `row` and `col`
+    lists.
+    """
+    def __init__(self, include_pos=False, emit=None):
         super().__init__()
-        self.include_pos = include_pos
+        self.pos_table = include_pos == POS_TABLE
+        self.include_pos = include_pos and not self.pos_table
+        self.emit = emit
+        self.reset()
+
+    def reset(self):
+        """Forget positions left over from an unfinished parse.
+        """
+        self.rows = []
+        self.cols = []
+
+    def _instr_pos(self, out, token):
+        if self.pos_table:
+            self.rows.append(token.line)
+            self.cols.append(token.column)
+        elif self.include_pos:
+            out['pos'] = _pos(token)
+
+    def _toplevel(self, item):
+        if self.emit is None:
+            return item
+        self.emit(item)
+        return None
 
     def start(self, items):
+        items = [i for i in items if i is not None]
         structs = [i for i in items if 'mbrs' in i]
         funcs = [i for i in items if 'mbrs' not in i]
         if structs:
@@ -96,31 +165,35 @@ class JSONTransformer(lark.Transformer):
             func['args'] = args
         if typ:
             func['type'] = typ
-        if self.include_pos:
+        if self.pos_table:
             func['pos'] = _pos(name)
-        return func
+            func['positions'] = {'row': self.rows, 'col': self.cols}
+            self.reset()
+        elif self.include_pos:
+            func['pos'] = _pos(name)
+        return self._toplevel(func)
 
     def arg(self, items):
         name = items.pop(0)
         typ = items.pop(0)
         return {
-            'name': name,
+            'name': str(name),
             'type': typ,
         }
 
     def struct(self, items):
         name = items[1]
         mbrs = items[2:]
-        return {
-            'name': name,
+        return self._toplevel({
+            'name': str(name),
             'mbrs': mbrs,
-        }
+        })
 
     def mbr(self, items):
         name = items.pop(0)
         typ = items.pop(0)
         return {
-            'name': name,
+            'name': str(name),
             'type': typ,
         }
 
@@ -136,8 +209,7 @@ class JSONTransformer(lark.Transformer):
         }
         if type:
             out['type'] = type
-        if self.include_pos:
-            out['pos'] = _pos(dest)
+        self._instr_pos(out, dest)
         return out
 
     def vop(self, items):
@@ -146,7 +218,11 @@ class JSONTransformer(lark.Transformer):
         if type:
             out['type'] = type
         out.update(op)
-        if self.include_pos:
+        if self.pos_table:
+            # Use the destination's position, not the operation's.
+            self.rows[-1] = dest.line
+            self.cols[-1] = dest.column
+        elif self.include_pos:
             out['pos'] = _pos(dest)
         return out
 
@@ -172,8 +248,7 @@ class JSONTransformer(lark.Transformer):
             out['funcs'] = funcs
         if labels:
             out['labels'] = labels
-        if self.include_pos:
-            out['pos'] = _pos(op_token)
+        self._instr_pos(out, op_token)
         return out
 
     def eop(self, items):
@@ -185,8 +260,7 @@ class JSONTransformer(lark.Transformer):
         out = {
             'label': str(name)[1:]  # Strip `.`.
         }
-        if self.include_pos:
-            out['pos'] = _pos(name)
+        self._instr_pos(out, name)
         return out
 
     def int(self, items):
@@ -199,7 +273,7 @@ class JSONTransformer(lark.Transformer):
             return False
 
     def paramtype(self, items):
-        return {items[0]: items[1]}
+        return {str(items[0]): items[1]}
 
     def primtype(self, items):
         return str(items[0])
@@ -211,15 +285,208 @@ class JSONTransformer(lark.Transformer):
         return 0
 
 
+def _make_parser(transformer=None):
+    """Build an LALR parser for the text format.
+
+    Lark saves the compiled parse tables to an on-disk cache (keyed on
+    the grammar and the Lark version), so only the first process to
+    build a parser pays to analyze the grammar. With a `transformer`,
+    the parser runs it inline and produces Bril data instead of a tree.
+    """
+    return lark.Lark(GRAMMAR, parser='lalr', maybe_placeholders=True,
+                     cache=True, transformer=transformer)
+
+
+@functools.lru_cache(maxsize=None)
+def _parser(include_pos=False, stream=False):
+    """Get the parser that produces a whole Bril program as a dict or,
+    with `stream`, the one `iter_bril` points at its own `emit` callback
+    for each parse.
+
+    Each parser is built once per process.
+    """
+    return _make_parser(JSONTransformer(include_pos))
+
+
+def iter_bril(txt, include_pos=False):
+    """Parse a Bril program incrementally.
+
+    Generate the program's top-level structs and functions in source
+    order, each as soon as its closing brace has been parsed. Neither a
+    parse tree nor the whole program is ever held in memory.
+    """
+    pending = collections.deque()
+    parser = _parser(include_pos, stream=True)
+    transformer = parser.options.transformer
+    if transformer.emit is not None:
+        # Another parse is still being iterated over; don't steal its
+        # items.
+        transformer = JSONTransformer(include_pos)
+        parser = _make_parser(transformer)
+    transformer.reset()
+    transformer.emit = pending.append
+    try:
+        interactive = parser.parse_interactive(txt)
+        for _ in interactive.iter_parse():
+            while pending:
+                yield pending.popleft()
+        interactive.feed_eof()
+        while pending:
+            yield pending.popleft()
+    finally:
+        transformer.emit = None
+
+
+def parse_prog(txt, include_pos=False):
+    """Parse a Bril program and return it as JSON data (a dict), ready
+    to hand to a pass in the same process.
+
+    Optionally include source position information: with
+    `include_pos=True`, every function, instruction, and label gets a
+    `pos` field, and with `include_pos=POS_TABLE`, each function gets a
+    single `positions` table instead (see `instr_pos`).
+    """
+    parser = _parser(include_pos)
+    parser.options.transformer.reset()
+    return parser.parse(txt)
+
+
+# Skip comments while matching the braces around top-level items.
+_BRACES = re.compile(r'#[^\n]*|[{}]')
+_BLANK = re.compile(r'\s*(#[^\n]*)?$')
+
+
+def _split_toplevel(txt, nchunks):
+    """Split the source text of a program into about `nchunks` pieces,
+    each holding whole top-level functions and structs and each starting
+    at the beginning of a line. Generate `(offset, text)` pairs, where
+    `offset` is the number of lines before the piece.
+    """
+    # Places where a top-level item has ended and the next one can begin
+    # on a new line.
+    splits = []
+    depth = 0
+    for match in _BRACES.finditer(txt):
+        if match.group() == '{':
+            depth += 1
+        elif match.group() == '}':
+            depth -= 1
+            if depth == 0:
+                end = txt.find('\n', match.end())
+                if end >= 0 and _BLANK.match(txt, match.end(), end):
+                    splits.append(end + 1)
+
+    # Pick the split points closest to even divisions of the text.
+    start = 0
+    line = 0
+    target = len(txt) // nchunks
+    for split in splits:
+        if split - start >= target and split < len(txt):
+            yield line, txt[start:split]
+            line += txt.count('\n', start, split)
+            start = split
+    yield line, txt[start:]
+
+
+def _shift_pos(item, lines):
+    if 'pos' in item:
+        item['pos']['row'] += lines
+    if 'positions' in item:
+        rows = item['positions']['row']
+        item['positions']['row'] = [r + lines if r else 0 for r in rows]
+
+
+def _parse_chunk(args):
+    """Parse one piece of a program in a worker process, with positions
+    relative to the whole file. Return None on a syntax error.
+    """
+    offset, txt, include_pos = args
+    try:
+        prog = parse_prog(txt, include_pos)
+    except lark.exceptions.LarkError:
+        return None
+    if include_pos and offset:
+        for func in prog['functions']:
+            _shift_pos(func, offset)
+            for instr in func['instrs']:
+                _shift_pos(instr, offset)
+    return prog
+
+
+def parse_prog_parallel(txt, include_pos=False, jobs=None,
+                        min_size=1 << 16):
+    """Like `parse_prog`, but parse the program's functions in a pool of
+    `jobs` worker processes (by default, one per CPU).
+
+    The source is split at top-level function and struct boundaries and
+    the pieces' results are merged in their original order. Programs
+    smaller than `min_size` characters are parsed serially.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1 or len(txt) < min_size:
+        return parse_prog(txt, include_pos)
+
+    chunks = [(offset, chunk, include_pos) for offset, chunk
+              in _split_toplevel(txt, 4 * jobs)]
+    if len(chunks) < 2:
+        return parse_prog(txt, include_pos)
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        results = list(pool.map(_parse_chunk, chunks))
+
+    if None in results:
+        # Parse serially to report the error at its place in the file.
+        return parse_prog(txt, include_pos)
+
+    funcs = []
+    structs = []
+    for prog in results:
+        funcs += prog['functions']
+        structs += prog.get('structs', [])
+    if structs:
+        return {'structs': structs, 'functions': funcs}
+    else:
+        return {'functions': funcs}
+
+
 def parse_bril(txt, include_pos=False):
     """Parse a Bril program and return a JSON string.
 
     Optionally include source position information.
     """
-    parser = lark.Lark(GRAMMAR, maybe_placeholders=True)
-    tree = parser.parse(txt)
-    data = JSONTransformer(include_pos).transform(tree)
-    return json.dumps(data, indent=2, sort_keys=True)
+    return json.dumps(parse_prog(txt, include_pos), indent=2,
+                      sort_keys=True)
+
+
+def _indent(txt, prefix):
+    return prefix + txt.replace('\n', '\n' + prefix)
+
+
+def write_json(items, out):
+    """Write a Bril program to the file `out` as JSON, one top-level
+    item at a time.
+
+    `items` is an iterable of structs and functions, like the one
+    produced by `iter_bril`. Functions are written out as they arrive.
+    The output is identical to dumping the whole program with
+    `indent=2, sort_keys=True`.
+    """
+    structs = []
+    out.write('{\n  "functions": [')
+    first = True
+    for item in items:
+        if 'mbrs' in item:
+            structs.append(item)
+            continue
+        out.write('\n' if first else ',\n')
+        out.write(_indent(json.dumps(item, indent=2, sort_keys=True),
+                          '    '))
+        first = False
+    out.write(']' if first else '\n  ]')
+    if structs:
+        out.write(',\n  "structs": ')
+        out.write(_indent(json.dumps(structs, indent=2, sort_keys=True),
+                          '  ')[2:])
+    out.write('\n}\n')
 
 
 # Text format pretty-printer.
@@ -234,36 +501,25 @@ def type_to_str(type):
 
 
 def instr_to_string(instr):
-    if instr['op'] == 'const':
-        tyann = ': {}'.format(type_to_str(instr['type'])) \
-            if 'type' in instr else ''
-        return '{}{} = const {}'.format(
-            instr['dest'],
-            tyann,
-            str(instr['value']).lower(),
-        )
+    op = instr['op']
+    if op == 'const':
+        rhs = 'const ' + str(instr['value']).lower()
     else:
-        rhs = instr['op']
+        parts = [op]
         if instr.get('funcs'):
-            rhs += ' {}'.format(' '.join(
-                '@{}'.format(f) for f in instr['funcs']
-            ))
+            parts.extend('@' + f for f in instr['funcs'])
         if instr.get('args'):
-            rhs += ' {}'.format(' '.join(instr['args']))
+            parts.extend(instr['args'])
         if instr.get('labels'):
-            rhs += ' {}'.format(' '.join(
-                '.{}'.format(f) for f in instr['labels']
-            ))
-        if 'dest' in instr:
-            tyann = ': {}'.format(type_to_str(instr['type'])) \
-                if 'type' in instr else ''
-            return '{}{} = {}'.format(
-                instr['dest'],
-                tyann,
-                rhs,
-            )
-        else:
+            parts.extend('.' + label for label in instr['labels'])
+        rhs = ' '.join(parts)
+        if 'dest' not in instr:
             return rhs
+    if 'type' in instr:
+        return instr['dest'] + ': ' + type_to_str(instr['type']) + \
+            ' = ' + rhs
+    else:
+        return instr['dest'] + ' = ' + rhs
 
 
 def print_instr(instr):
@@ -284,31 +540,519 @@ def args_to_string(args):
         return ''
 
 
-def print_func(func):
+def func_to_string(func):
+    """Format a whole function, including a trailing newline.
+    """
     typ = func.get('type', 'void')
-    print('@{}{}{} {{'.format(
+    lines = ['@{}{}{} {{'.format(
         func['name'],
         args_to_string(func.get('args', [])),
         ': {}'.format(type_to_str(typ)) if typ != 'void' else '',
-    ))
+    )]
     for instr_or_label in func['instrs']:
         if 'label' in instr_or_label:
-            print_label(instr_or_label)
+            lines.append('.' + instr_or_label['label'] + ':')
         else:
-            print_instr(instr_or_label)
-    print('}')
+            lines.append('  ' + instr_to_string(instr_or_label) + ';')
+    lines.append('}\n')
+    return '\n'.join(lines)
+
+
+def write_funcs(funcs, out):
+    """Pretty-print functions to the file `out`, with a single write
+    per function.
+    """
+    for func in funcs:
+        out.write(func_to_string(func))
+
+
+def write_prog(prog, out):
+    write_funcs(prog['functions'], out)
+
+
+def prog_to_string(prog):
+    """Pretty-print a Bril program, given as JSON data, to a string.
+    """
+    return ''.join(func_to_string(func) for func in prog['functions'])
+
+
+def print_func(func):
+    write_funcs([func], sys.stdout)
 
 
 def print_prog(prog):
-    for func in prog['functions']:
-        print_func(func)
+    write_prog(prog, sys.stdout)
+
+
+class _JSONStream:
+    """Decode JSON values one at a time from a text file, reading it in
+    chunks as needed.
+    """
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Read more input, discarding what has been consumed. The read
+        grows with the unconsumed part of the buffer so that re-decoding
+        a partial value costs amortized linear time. Return False at EOF.
+        """
+        if self.eof:
+            return False
+        pending = len(self.buf) - self.pos
+        data = self.f.read(max(self.chunk_size, 3 * pending))
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        if not data:
+            self.eof = True
+        return bool(data)
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at EOF).
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def take(self, expected):
+        if self.peek() != expected:
+            raise json.JSONDecodeError(
+                'Expecting {!r}'.format(expected), self.buf, self.pos,
+            )
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                val, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number could continue past the end of the buffer.
+            if end < len(self.buf) or not self._fill():
+                self.pos = end
+                return val
+
+
+def iter_json_funcs(f, chunk_size=1 << 20):
+    """Read a Bril program in JSON from the file `f` and generate its
+    functions one at a time, without loading the whole program.
+    """
+    stream = _JSONStream(f, chunk_size)
+    stream.take('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        key = stream.value()
+        stream.take(':')
+        if key == 'functions':
+            stream.take('[')
+            if stream.peek() == ']':
+                stream.pos += 1
+            else:
+                while True:
+                    yield stream.value()
+                    if stream.peek() != ',':
+                        break
+                    stream.pos += 1
+                stream.take(']')
+        else:
+            stream.value()  # Skip other top-level data.
+        if stream.peek() != ',':
+            break
+        stream.pos += 1
+    stream.take('}')
+
+
+# Compact binary format.
+#
+# A binary Bril file starts with a header and a table of interned
+# strings: every opcode, variable, label, function name, and type in the
+# program is stored once and referred to by its index. Each function is
+# a flat array of fixed-width int32 instruction records (the `_R_*`
+# fields), an int32 operand array holding the args, funcs, and labels of
+# all the records, and arrays of int64 and float64 constant values. Any
+# other JSON data (source positions, extension fields) is interned as a
+# JSON string, so conversion to and from JSON is lossless. All numbers
+# are little-endian.
+
+BIN_MAGIC = b'BRIL'
+BIN_VERSION = 1
+
+# Magic, version, #strings, #string bytes, extra, #functions.
+_HEADER = struct.Struct('<4sIIIiI')
+
+# Name, type, extra, #args, #instrs, #operands, #ints, #floats.
+_FUNC_HEADER = struct.Struct('<8i')
+
+# Instruction record fields.
+_R_OP = 0  # Opcode string, or -1 for a label.
+_R_DEST = 1  # Destination (or label name) string, or -1.
+_R_TYPE = 2  # Type string, or -1.
+_R_FLAGS = 3  # The `_F_*` flags and the value kind.
+_R_START = 4  # Index of the first operand.
+_R_NARGS = 5
+_R_NFUNCS = 6
+_R_NLABELS = 7
+_R_VALUE = 8  # Constant value slot (see the `_V_*` kinds).
+_R_EXTRA = 9  # Interned JSON for any other keys, or -1.
+_RECORD = 10
+
+# Flags for which operand lists are present (even if empty).
+_F_ARGS = 1
+_F_FUNCS = 2
+_F_LABELS = 4
+_V_SHIFT = 4
+
+# Constant value kinds.
+_V_NONE = 0
+_V_INT = 1  # Index into the int64 array.
+_V_FLOAT = 2  # Index into the float64 array.
+_V_BOOL = 3  # 0 or 1.
+_V_JSON = 4  # Interned JSON string.
+
+_INSTR_KEYS = {'op', 'dest', 'type', 'args', 'funcs', 'labels', 'value',
+               'label'}
+_FUNC_KEYS = {'name', 'type', 'args', 'instrs'}
+
+
+def _le_bytes(arr):
+    if sys.byteorder == 'big':
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _le_view(view, typecode):
+    """View little-endian bytes as an array of numbers without copying
+    (where the host byte order allows it).
+    """
+    if sys.byteorder == 'little':
+        return view.cast(typecode)
+    arr = array.array(typecode)
+    arr.frombytes(view)
+    arr.byteswap()
+    return arr
+
+
+def _pad8(n):
+    return -n % 8
+
+
+def _is_names(val):
+    return isinstance(val, list) and all(isinstance(v, str) for v in val)
+
+
+class _BinWriter:
+    def __init__(self):
+        self.strings = {}
+
+    def intern(self, s):
+        try:
+            return self.strings[s]
+        except KeyError:
+            idx = self.strings[s] = len(self.strings)
+            return idx
+
+    def intern_type(self, typ):
+        if isinstance(typ, str) and not typ.startswith('{'):
+            return self.intern(typ)
+        return self.intern(json.dumps(typ, sort_keys=True))
+
+    def intern_extra(self, obj, known):
+        extra = {k: v for k, v in obj.items() if k not in known}
+        if extra:
+            return self.intern(json.dumps(extra, sort_keys=True))
+        return -1
+
+    def func(self, func):
+        known = set(_FUNC_KEYS)
+        args = array.array('i')
+        nargs = -1
+        if 'args' in func:
+            if all(isinstance(a, dict) and set(a) == {'name', 'type'}
+                   for a in func['args']):
+                nargs = len(func['args'])
+                for arg in func['args']:
+                    args.append(self.intern(arg['name']))
+                    args.append(self.intern_type(arg['type']))
+            else:
+                known.discard('args')
+
+        recs = array.array('i')
+        operands = array.array('i')
+        ints = array.array('q')
+        floats = array.array('d')
+        for instr in func['instrs']:
+            rec = [-1, -1, -1, 0, len(operands), 0, 0, 0, 0, -1]
+            instr_known = set(_INSTR_KEYS)
+            if 'label' in instr and 'op' not in instr:
+                rec[_R_DEST] = self.intern(instr['label'])
+            else:
+                rec[_R_OP] = self.intern(instr['op'])
+                instr_known.discard('label')
+                if isinstance(instr.get('dest'), str):
+                    rec[_R_DEST] = self.intern(instr['dest'])
+                else:
+                    instr_known.discard('dest')
+                if 'type' in instr:
+                    rec[_R_TYPE] = self.intern_type(instr['type'])
+                for key, field, flag in (('args', _R_NARGS, _F_ARGS),
+                                         ('funcs', _R_NFUNCS, _F_FUNCS),
+                                         ('labels', _R_NLABELS, _F_LABELS)):
+                    if key not in instr:
+                        continue
+                    if not _is_names(instr[key]):
+                        instr_known.discard(key)
+                        continue
+                    rec[_R_FLAGS] |= flag
+                    rec[field] = len(instr[key])
+                    operands.extend(self.intern(v) for v in instr[key])
+                if 'value' in instr:
+                    kind, rec[_R_VALUE] = self.value(instr['value'], ints,
+                                                     floats)
+                    rec[_R_FLAGS] |= kind << _V_SHIFT
+            rec[_R_EXTRA] = self.intern_extra(instr, instr_known)
+            recs.extend(rec)
+
+        header = _FUNC_HEADER.pack(
+            self.intern(func['name']),
+            self.intern_type(func['type']) if 'type' in func else -1,
+            self.intern_extra(func, known), nargs,
+            len(func['instrs']), len(operands), len(ints), len(floats),
+        )
+        body = _le_bytes(args) + _le_bytes(recs) + _le_bytes(operands)
+        body += b'\0' * _pad8(len(header) + len(body))
+        return header + body + _le_bytes(ints) + _le_bytes(floats)
+
+    def value(self, val, ints, floats):
+        if isinstance(val, bool):
+            return _V_BOOL, int(val)
+        elif isinstance(val, int) and -2 ** 63 <= val < 2 ** 63:
+            ints.append(val)
+            return _V_INT, len(ints) - 1
+        elif isinstance(val, float):
+            floats.append(val)
+            return _V_FLOAT, len(floats) - 1
+        else:
+            return _V_JSON, self.intern(json.dumps(val))
+
+
+def dumps_bin(prog):
+    """Encode a Bril program in the binary format.
+    """
+    writer = _BinWriter()
+    funcs = [writer.func(func) for func in prog['functions']]
+    extra = writer.intern_extra(prog, {'functions'})
+
+    strings = [s.encode('utf8') for s in writer.strings]
+    lengths = array.array('I', (len(s) for s in strings))
+    out = [_HEADER.pack(BIN_MAGIC, BIN_VERSION, len(strings),
+                        sum(lengths), extra, len(funcs)),
+           _le_bytes(lengths)]
+    out += strings
+    size = sum(len(b) for b in out)
+    out.append(b'\0' * _pad8(size))
+    size += _pad8(size)
+
+    # Offsets of each function.
+    offsets = array.array('Q')
+    size += 8 * len(funcs)
+    for func in funcs:
+        offsets.append(size)
+        size += len(func)
+    out.append(_le_bytes(offsets))
+    out += funcs
+    return b''.join(out)
+
+
+def dump_bin(prog, f):
+    """Write a Bril program to the binary file `f`.
+    """
+    f.write(dumps_bin(prog))
+
+
+class BinProgram:
+    """A Bril program in the binary format.
+
+    The program wraps any buffer: bytes or, via `open_bin`, a memory map
+    of a file. Only the header and string table are decoded up front.
+    Instruction records are read in place and each function is decoded
+    only when it is asked for.
+    """
+    def __init__(self, buf):
+        self.buf = memoryview(buf)
+        magic, version, nstrings, strbytes, extra, nfuncs = \
+            _HEADER.unpack_from(self.buf)
+        if magic != BIN_MAGIC or version != BIN_VERSION:
+            raise ValueError('not a binary Bril program (version {})'
+                             .format(BIN_VERSION))
+        pos = _HEADER.size
+        lengths = _le_view(self.buf[pos:pos + 4 * nstrings], 'I')
+        pos += 4 * nstrings
+        self.strings = []
+        for length in lengths:
+            self.strings.append(str(self.buf[pos:pos + length], 'utf8'))
+            pos += length
+        pos += _pad8(pos)
+        self.offsets = _le_view(self.buf[pos:pos + 8 * nfuncs], 'Q')
+        self.extra = extra
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _type(self, idx):
+        typ = self.strings[idx]
+        return json.loads(typ) if typ.startswith('{') else typ
+
+    def _extra(self, obj, idx):
+        if idx >= 0:
+            obj.update(json.loads(self.strings[idx]))
+        return obj
+
+    def func(self, i):
+        """Decode the `i`th function as Bril JSON data.
+        """
+        strings = self.strings
+        pos = self.offsets[i]
+        name, typ, extra, nargs, ninstrs, noperands, nints, nfloats = \
+            _FUNC_HEADER.unpack_from(self.buf, pos)
+        pos += _FUNC_HEADER.size
+
+        def ints(count, typecode='i', size=4):
+            nonlocal pos
+            arr = _le_view(self.buf[pos:pos + size * count], typecode)
+            pos += size * count
+            return arr
+
+        args = ints(2 * max(nargs, 0))
+        recs = ints(_RECORD * ninstrs)
+        operands = ints(noperands)
+        pos += _pad8(pos)
+        int_vals = ints(nints, 'q', 8)
+        float_vals = ints(nfloats, 'd', 8)
+
+        func = {'name': strings[name]}
+        if nargs >= 0:
+            func['args'] = [
+                {'name': strings[args[j]], 'type': self._type(args[j + 1])}
+                for j in range(0, len(args), 2)
+            ]
+        if typ >= 0:
+            func['type'] = self._type(typ)
+
+        instrs = []
+        for (op, dest, typ, flags, start, nargs, nfuncs, nlabels, val,
+             extra_idx) in zip(*[iter(recs)] * _RECORD):
+            if op < 0:
+                instr = {'label': strings[dest]}
+            else:
+                instr = {'op': strings[op]}
+                if dest >= 0:
+                    instr['dest'] = strings[dest]
+                if typ >= 0:
+                    instr['type'] = self._type(typ)
+                if flags & _F_ARGS:
+                    instr['args'] = [strings[v] for v in
+                                     operands[start:start + nargs]]
+                    start += nargs
+                if flags & _F_FUNCS:
+                    instr['funcs'] = [strings[v] for v in
+                                      operands[start:start + nfuncs]]
+                    start += nfuncs
+                if flags & _F_LABELS:
+                    instr['labels'] = [strings[v] for v in
+                                       operands[start:start + nlabels]]
+                kind = flags >> _V_SHIFT
+                if kind == _V_INT:
+                    instr['value'] = int_vals[val]
+                elif kind == _V_FLOAT:
+                    instr['value'] = float_vals[val]
+                elif kind == _V_BOOL:
+                    instr['value'] = bool(val)
+                elif kind == _V_JSON:
+                    instr['value'] = json.loads(strings[val])
+            if extra_idx >= 0:
+                self._extra(instr, extra_idx)
+            instrs.append(instr)
+        func['instrs'] = instrs
+        return self._extra(func, extra)
+
+    def funcs(self):
+        for i in range(len(self)):
+            yield self.func(i)
+
+    def prog(self):
+        """Decode the whole program as Bril JSON data.
+        """
+        return self._extra({'functions': list(self.funcs())}, self.extra)
+
+
+def loads_bin(data):
+    """Decode a Bril program from bytes in the binary format.
+    """
+    return BinProgram(data).prog()
+
+
+def load_bin(f):
+    """Read a Bril program from the binary file `f`.
+    """
+    return loads_bin(f.read())
+
+
+def open_bin(path):
+    """Memory-map a binary Bril file and return a `BinProgram` for it.
+    """
+    with open(path, 'rb') as f:
+        return BinProgram(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
 
 
 # Command-line entry points.
 
+def jobs_flag(args):
+    """Get the number of worker processes from a `-j [N]` flag: 1 if
+    there is no flag, or None (one per CPU) if it has no number.
+    """
+    if '-j' not in args:
+        return 1
+    idx = args.index('-j')
+    if idx + 1 < len(args) and args[idx + 1].isdigit():
+        return int(args[idx + 1])
+    return None  # One per CPU.
+
+
 def bril2json():
-    print(parse_bril(sys.stdin.read(), '-p' in sys.argv[1:]))
+    txt = sys.stdin.read()
+    include_pos = '-p' in sys.argv[1:]
+    if '-P' in sys.argv[1:]:
+        include_pos = POS_TABLE
+    jobs = jobs_flag(sys.argv[1:])
+    if jobs == 1:
+        # Parse everything before writing anything, so that a syntax error
+        # produces no output rather than truncated JSON.
+        write_json(list(iter_bril(txt, include_pos)), sys.stdout)
+    else:
+        prog = parse_prog_parallel(txt, include_pos, jobs)
+        write_json(prog.get('structs', []) + prog['functions'], sys.stdout)
 
 
 def bril2txt():
-    print_prog(json.load(sys.stdin))
+    write_funcs(iter_json_funcs(sys.stdin), sys.stdout)
+
+
+def json2bin():
+    dump_bin(json.load(sys.stdin), sys.stdout.buffer)
+
+
+def bin2json():
+    json.dump(load_bin(sys.stdin.buffer), sys.stdout, indent=2,
+              sort_keys=True)
+    print()
@@ -0,0 +1,296 @@
+"""Run a pipeline of Bril passes in a single process.
+
+    bril2json < prog.bril | python3 bril_opt.py -p tdce+,lvn:pcf,ssa,tdce+
+
+The program is read once (as JSON, as the text format, or in the binary
+format), every pass in the pipeline transforms it in memory, and the
+result is serialized once at the end. Passes are written `name` or
+`name:flags`; run with `-l` to list them. Analyses print their results
+to stderr so that the program on stdout stays intact.
+
+Passes share an `analysis.AnalysisManager`, so a dominator tree computed
+by one pass is reused by the next as long as the control flow between
+them has not changed.
+
+With `-j`, each function goes through the whole pipeline on its own in a
+pool of worker processes (see `examples/parallel.py`). All the passes
+here work on one function at a time, so the result is the same.
+"""
+
+import argparse
+import collections
+import contextlib
+import functools
+import importlib.util
+import io
+import json
+import os
+import sys
+import time
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES = os.path.join(BASE, 'examples')
+
+# The example passes import their helpers (`cfg`, `form_blocks`, ...) as
+# top-level modules.
+sys.path.append(EXAMPLES)
+sys.path.append(os.path.join(BASE, 'bril-txt'))
+
+from analysis import AnalysisManager  # noqa: E402
+from parallel import map_funcs  # noqa: E402
+
+_modules = {}
+
+
+def load(path):
+    """Import a pass's module from a path relative to the repository
+    root. Several passes share a file name, so each module is registered
+    under a name derived from its whole path.
+    """
+    if path not in _modules:
+        name = 'bril_opt_' + os.path.splitext(path)[0].replace('/', '_')
+        spec = importlib.util.spec_from_file_location(
+            name, os.path.join(BASE, path),
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[path] = module
+    return _modules[path]
+
+
+def examples_tdce(mode):
+    """Make a pass from one of the modes of `examples/tdce.py`, which
+    modify each function in place.
+    """
+    def run(bril, flags, am):
+        modify_func = load('examples/tdce.py').MODES[mode]
+        for func in bril['functions']:
+            modify_func(func)
+        return bril
+    return run
+
+
+def examples_lvn(bril, flags, am):
+    load('examples/lvn.py').lvn(bril, 'p' in flags, 'c' in flags,
+                                'f' in flags)
+    return bril
+
+
+def whole_program(path, func_name):
+    """Make a pass from a function that takes and returns a program.
+    The pass takes no flags.
+    """
+    def run(bril, flags, am):
+        if flags:
+            raise ValueError('{} in {} takes no flags'.format(func_name, path))
+        return getattr(load(path), func_name)(bril)
+    return run
+
+
+def examples_ssa(bril, flags, am):
+    return load('examples/to_ssa.py').to_ssa(bril, am,
+                                             mode=flags or 'minimal')
+
+
+def top_ssa(bril, flags, am):
+    return load('to_ssa.py').main(bril, flags or 'minimal')
+
+
+def examples_df(bril, flags, am):
+    df = load('examples/df.py')
+    stats = collections.Counter()
+    with contextlib.redirect_stdout(sys.stderr):
+        df.run_df(bril, df.ANALYSES[flags or 'defined'], stats)
+    for event, count in stats.items():
+        am.stats['df', event] += count
+    return bril
+
+
+def examples_dom(bril, flags, am):
+    with contextlib.redirect_stdout(sys.stderr):
+        load('examples/dom.py').print_dom(bril, flags or 'dom', am)
+    return bril
+
+
+PASSES = {
+    'tdce': examples_tdce('tdce'),
+    'tdcep': examples_tdce('tdcep'),
+    'dkp': examples_tdce('dkp'),
+    'tdce+': examples_tdce('tdce+'),
+    'lvn': examples_lvn,
+    'ssa': examples_ssa,
+    'from_ssa': whole_program('examples/from_ssa.py', 'from_ssa'),
+    'sccp': whole_program('examples/sccp.py', 'sccp'),
+    'dce': whole_program('examples/dce.py', 'dce'),
+    'df': examples_df,
+    'dom': examples_dom,
+    'top-tdce': whole_program('tdce.py', 'main'),
+    'top-lvn': whole_program('lvn.py', 'main'),
+    'top-ssa': top_ssa,
+}
+
+HELP = {
+    'tdce': 'trivial dead code elimination (examples/tdce.py)',
+    'tdcep': 'a single global pass of tdce',
+    'dkp': 'a single pass deleting locally killed instructions',
+    'tdce+': 'tdce plus locally killed instructions, to convergence',
+    'lvn': 'local value numbering; flags: p(rop), c(anon), f(old)',
+    'ssa': 'convert to SSA form (examples/to_ssa.py); flags: minimal, '
+           'semi-pruned, or pruned',
+    'from_ssa': 'convert out of SSA form (examples/from_ssa.py)',
+    'sccp': 'sparse conditional constant propagation, on SSA form',
+    'dce': 'dead code elimination using live variables (examples/dce.py)',
+    'df': 'print a data flow analysis: defined, live, or cprop',
+    'dom': 'print dominators; flags: dom, front, or tree',
+    'top-tdce': 'dead code elimination (tdce.py)',
+    'top-lvn': 'local value numbering (lvn.py)',
+    'top-ssa': 'convert to SSA form (to_ssa.py); flags: minimal, '
+               'semi-pruned, or pruned',
+}
+
+# The analyses each pass leaves intact (`True` for all of them). Other
+# cached analyses are invalidated after the pass runs.
+PRESERVES = {
+    'df': True,
+    'dom': True,
+}
+
+
+def parse_pipeline(spec):
+    """Parse a comma-separated pipeline into `(name, flags)` pairs.
+    """
+    pipeline = []
+    for item in spec.split(','):
+        name, _, flags = item.strip().partition(':')
+        if name not in PASSES:
+            raise ValueError('unknown pass: {}'.format(name))
+        pipeline.append((name, flags))
+    return pipeline
+
+
+def run_pipeline(bril, pipeline, timings=None, am=None):
+    """Run each pass in a pipeline on a program and return the result.
+    If `timings` is a list, append each pass's `(name, seconds)` to it.
+    """
+    am = am or AnalysisManager()
+    for name, flags in pipeline:
+        start = time.perf_counter()
+        bril = PASSES[name](bril, flags, am)
+        am.invalidate(preserve=PRESERVES.get(name, ()))
+        if timings is not None:
+            timings.append((name, time.perf_counter() - start))
+    return bril
+
+
+def _run_func(pipeline, timed, rest, func):
+    """Run a pipeline on a program with a single function. Return its
+    functions, the analysis statistics, the timings, and the analyses'
+    output.
+    """
+    am = AnalysisManager()
+    timings = [] if timed else None
+    with contextlib.redirect_stderr(io.StringIO()) as err:
+        bril = run_pipeline(dict(rest, functions=[func]), pipeline,
+                            timings, am)
+    return bril['functions'], am.stats, timings, err.getvalue()
+
+
+def run_pipeline_parallel(bril, pipeline, jobs=None, timings=None,
+                          am=None):
+    """Like `run_pipeline`, but run the whole pipeline on each function
+    separately, using `jobs` worker processes. Add up the time each pass
+    takes on all functions and the statistics in `am.stats`.
+    """
+    rest = {k: v for k, v in bril.items() if k != 'functions'}
+    run = functools.partial(_run_func, pipeline, timings is not None, rest)
+    funcs = []
+    totals = [0.0] * len(pipeline)
+    for func_funcs, stats, func_timings, err in map_funcs(
+            run, bril['functions'], jobs, inplace=False):
+        funcs += func_funcs
+        if am is not None:
+            am.stats.update(stats)
+        for i, (_, elapsed) in enumerate(func_timings or ()):
+            totals[i] += elapsed
+        sys.stderr.write(err)
+    if timings is not None:
+        timings += [(name, total)
+                    for (name, _), total in zip(pipeline, totals)]
+    return dict(rest, functions=funcs)
+
+
+def read_prog(f):
+    """Read a program in any of the JSON, text, or binary formats.
+    """
+    data = f.buffer.read()
+    if data.startswith(b'BRIL'):
+        import briltxt
+        return briltxt.loads_bin(data)
+    txt = data.decode('utf8')
+    if txt.lstrip().startswith('{'):
+        return json.loads(txt)
+    import briltxt
+    return briltxt.parse_prog(txt)
+
+
+def write_prog(bril, fmt, f):
+    if fmt == 'json':
+        json.dump(bril, f, indent=2, sort_keys=True)
+        f.write('\n')
+    elif fmt == 'txt':
+        import briltxt
+        briltxt.write_prog(bril, f)
+    else:
+        import briltxt
+        f.flush()
+        briltxt.dump_bin(bril, f.buffer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-p', '--passes', default='',
+                        help='comma-separated pipeline, e.g. tdce+,lvn:pcf')
+    parser.add_argument('-o', '--output', choices=('json', 'txt', 'bin'),
+                        default='json', help='output format')
+    parser.add_argument('-l', '--list', action='store_true',
+                        help='list the available passes')
+    parser.add_argument('-t', '--time', action='store_true',
+                        help='print the time taken by each pass to stderr')
+    parser.add_argument('-s', '--stats', action='store_true',
+                        help='print analysis statistics to stderr')
+    parser.add_argument('-j', '--jobs', type=int, nargs='?', const=0,
+                        default=1, help='worker processes (default: one '
+                        'per CPU)')
+    args = parser.parse_args()
+
+    if args.list:
+        for name in PASSES:
+            print('{:<10} {}'.format(name, HELP[name]))
+        return
+
+    try:
+        pipeline = parse_pipeline(args.passes) if args.passes else []
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    am = AnalysisManager()
+    timings = [] if args.time else None
+    if args.jobs == 1:
+        bril = run_pipeline(read_prog(sys.stdin), pipeline, timings, am)
+    else:
+        bril = run_pipeline_parallel(read_prog(sys.stdin), pipeline,
+                                     args.jobs or None, timings, am)
+    write_prog(bril, args.output, sys.stdout)
+
+    if args.stats:
+        for (name, event), count in sorted(am.stats.items()):
+            print('{:<10} {:<8} {}'.format(name, event, count),
+                  file=sys.stderr)
+
+    if timings is not None:
+        for name, elapsed in timings:
+            print('{:<10} {:.3f} s'.format(name, elapsed), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
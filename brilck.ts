@@ -346,6 +346,16 @@ function checkFunc(funcs: FuncEnv, func: bril.Function) {
   let vars: VarEnv = new Map();
   let labels = new Set<bril.Ident>();
 
+  // Attach positions from the function's position table, if any.
+  if (func.positions && func.instrs) {
+    let {row, col} = func.positions;
+    func.instrs.forEach((instr, i) => {
+      if (row[i] && !instr.pos) {
+        instr.pos = {row: row[i], col: col[i]};
+      }
+    });
+  }
+
   // Initilize the type environment with the arguments.
   if (func.args) {
     for (let arg of func.args) {
@@ -1,11 +1,21 @@
 import sys
 import json
-from typing import Tuple, List, Dict, Set
+import copy
+import time
+from collections import Counter
+from typing import Any, Tuple, List, Dict, Set
 from typing_extensions import TypeAlias
 from dataclasses import dataclass
+import os
 import random
 random.seed(0)
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples'))
+from cfg import CFG
+from df import Facts
+import traverse
+import worklist
+
 @dataclass
 class BasicBlock:
     label: str
@@ -15,93 +25,130 @@ class BasicBlock:
 
 
 
-def program_to_basic_blocks(program: dict) -> Dict[str, BasicBlock]:
+def function_to_basic_blocks(function: dict) -> Dict[str, BasicBlock]:
+    graph = CFG(function['instrs'])
     basic_blocks = {}
-    predecessors = {}
-
-    for function in program['functions']:
-        label = 'b1'
-        instrs = []
-        blocks = []
-        for instr in function['instrs']:
-            if 'label' in instr:
-                blocks.append((label,instrs))
-                predecessors[label] = []
-                label = instr['label']
-                instrs = []
-
-
-            # if 'dest' in instr:
-                # instr['dest'] = instr['dest'] + '.' + label
-            instrs.append(instr)
-
-        blocks.append((label, instrs))
-        predecessors[label] = []
-
-    for i, (label, instrs) in enumerate(blocks):
-        successors = []
-        branch_found = False
-        for instr in instrs:
-            if 'op' in instr and instr['op'] in ['jmp', 'br']:
-                branch_found = True
-                for l in instr['labels']:
-                    successors.append(l)
-                    predecessors[l].append(label)
-
-        # yikes
-        if len(predecessors[label]) == 0 and i > 0:
-            prev_label = blocks[i-1][0]
-            predecessors[label] = [prev_label]
-
-        # double yikes
-        if not branch_found and i  == 0:
-            next_label = blocks[i+1][0]
-            successors.append(next_label)
-
-        basic_blocks[label] = BasicBlock(
-            label, instrs, set(predecessors[label]), set(successors))
-
-
-    for label, block in basic_blocks.items():
-        block.predecessors =  block.predecessors.union(set(predecessors[label]))
+    for block in graph:
+        instrs = ([block.label] if block.label else []) + block.instrs
+        basic_blocks[block.name] = BasicBlock(
+            block.name, instrs,
+            {graph.blocks[p].name for p in graph.preds[block.id]},
+            {graph.blocks[s].name for s in graph.succs[block.id]})
     return basic_blocks
 
 
-def data_flow_worklist(blocks: Dict[str, BasicBlock], merge_fn, transfer_fn):
-    in_ = {}
-    out = {}
-    for label in blocks.keys():
-        in_[label] = {}
-        out[label] = {}
+@dataclass
+class Lattice:
+    """The values of a data flow problem. Every block's facts start out
+    as `bottom` before the first visit. `boundary` is what is known at
+    the edge of the function: the value flowing into the entry block of
+    a forward problem, or out of the exit blocks of a backward one. It
+    need not be the lattice's top; for a may-analysis over sets, such as
+    reaching definitions or live variables, it is the empty set.
+    """
+    bottom: Any
+    boundary: Any
 
 
-    worklist = []
-    for block in blocks.values():
-        worklist.append(block)
+SETS = Lattice(bottom=frozenset(), boundary=frozenset())
 
-    while len(worklist) > 0:
-        block = worklist.pop(0)
-        label = block.label
-        out_prev = out[label].copy()
-        in_[label] = merge_fn([out[p] for p in block.predecessors])
-        out[label] = transfer_fn(block, in_[label])
 
-        if out_prev != out[label]:
-            for l in block.successors:
-                found = False
-                for b in worklist:
-                    if b.label == l:
-                        found = True
-                        break
-                if not found:
-                    worklist.extend([v for ll,v in blocks.items() if ll == l])
+def program_to_basic_blocks(program: dict) -> Dict[str, BasicBlock]:
+    basic_blocks = {}
+    for function in program['functions']:
+        basic_blocks.update(function_to_basic_blocks(function))
+    return basic_blocks
 
 
+def _timed(fn, calls: str, seconds: str, stats: Counter):
+    """Wrap a function to count its calls in `stats[calls]` and the time
+    they take in `stats[seconds]`.
+    """
+    def wrapper(*args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            stats[calls] += 1
+            stats[seconds] += time.perf_counter() - start
+    return wrapper
+
+
+def data_flow_worklist(blocks: Dict[str, BasicBlock], merge_fn, transfer_fn,
+                       stats=None, forward=True, lattice: Lattice = SETS):
+    """Solve a data flow problem over the blocks of a function.
+
+    For a forward problem, `merge_fn` combines the out facts of a block's
+    predecessors and `transfer_fn(block, in_)` computes its out facts.
+    For a backward problem, `merge_fn` combines the in facts of its
+    successors and `transfer_fn(block, out)` computes its in facts.
+    Either way, return the facts at the start and end of every block as
+    `(in_, out)`.
+
+    If `stats` is a `Counter`, add the number of worklist sweeps
+    (`iterations`), the number of `transfers` (one per block visit) and
+    `merges`, and the seconds spent in each (`transfer_time`,
+    `merge_time`) to it.
+    """
+    in_ = {label: copy.copy(lattice.bottom) for label in blocks}
+    out = {label: copy.copy(lattice.bottom) for label in blocks}
+
+    if stats is not None:
+        merge_fn = _timed(merge_fn, 'merges', 'merge_time', stats)
+        transfer_fn = _timed(transfer_fn, 'transfers', 'transfer_time', stats)
+
+    # Number the blocks so the shared worklist can visit them in reverse
+    # postorder (or postorder, backward), starting from the first block.
+    labels = list(blocks)
+    index = {label: i for i, label in enumerate(labels)}
+    succs = [[index[l] for l in block.successors if l in index]
+             for block in blocks.values()]
+    preds = [[index[l] for l in block.predecessors if l in index]
+             for block in blocks.values()]
+    order = traverse.reverse_postorder(succs, range(len(labels)))
+
+    if forward:
+        before, after, in_edges, out_edges = in_, out, preds, succs
+        boundary_blocks = {0} if labels else set()
+    else:
+        before, after, in_edges, out_edges = out, in_, succs, preds
+        boundary_blocks = {i for i, edges in enumerate(succs) if not edges}
+        order.reverse()
+
+    def visit(i):
+        label = labels[i]
+        values = [after[labels[e]] for e in in_edges[i]]
+        if i in boundary_blocks:
+            values.append(lattice.boundary)
+        after_prev = after[label]
+        before[label] = merge_fn(values)
+        after[label] = transfer_fn(blocks[label], before[label])
+        return after_prev != after[label]
+
+    counts = Counter()
+    worklist.iterate(order, out_edges, visit, counts)
+    if stats is not None:
+        stats['iterations'] += counts['iterations']
 
     return in_, out
 
 
-def reaching_definition(blocks: Dict[str, BasicBlock]):
+def instruction_facts(blocks: Dict[str, BasicBlock], in_, out, transfer_fn,
+                      forward=True) -> Facts:
+    """Wrap the results of `data_flow_worklist` so that the facts between
+    instructions can be queried with `at(label, index)`, replaying
+    `transfer_fn` over one instruction at a time. Block instructions
+    here include the leading label, so index 1 is after the label.
+    """
+    def step(instr, value):
+        return transfer_fn(BasicBlock(None, [instr], set(), set()), value)
+
+    return Facts({label: block.instrs for label, block in blocks.items()},
+                 step, forward, in_, out)
+
+
+def reaching_definition(blocks: Dict[str, BasicBlock], facts=False,
+                        stats=None):
     def merge_fn(out_prev: List[Set[str]]):
         result = set()
         for o in out_prev:
@@ -117,13 +164,55 @@ def reaching_definition(blocks: Dict[str, BasicBlock]):
         result = result.union(in_)
         return result
 
-    return data_flow_worklist(blocks, merge_fn, transfer_fn)
+    in_, out = data_flow_worklist(blocks, merge_fn, transfer_fn, stats)
+    if facts:
+        # Also answer queries about single instructions.
+        return instruction_facts(blocks, in_, out, transfer_fn)
+    return in_, out
+
+
+def live_variables(blocks: Dict[str, BasicBlock], facts=False, stats=None):
+    def merge_fn(in_succ: List[Set[str]]):
+        result = set()
+        for i in in_succ:
+            result |= i
+        return result
+
+    def transfer_fn(block, out):
+        result = set(out)
+        for instr in reversed(block.instrs):
+            if 'dest' in instr:
+                result.discard(instr['dest'])
+            result.update(instr.get('args', []))
+        return result
 
+    in_, out = data_flow_worklist(blocks, merge_fn, transfer_fn, stats,
+                                  forward=False)
+    if facts:
+        return instruction_facts(blocks, in_, out, transfer_fn,
+                                 forward=False)
+    return in_, out
 
-def main(program: dict) -> dict:
-    basic_blocks = program_to_basic_blocks(program)
 
-    in_, out = reaching_definition(basic_blocks)
+ANALYSES = {
+    'reaching': reaching_definition,
+    'live': live_variables,
+}
+
+
+def main(program: dict, analysis='reaching', stats=None) -> dict:
+    for function in program['functions']:
+        print_facts(*ANALYSES[analysis](function_to_basic_blocks(function),
+                                        stats=stats))
+
+    return program
+
+
+def print_reaching_definitions(basic_blocks: Dict[str, BasicBlock]):
+    print_facts(*reaching_definition(basic_blocks))
+
+
+def print_facts(in_, out):
     for l, v in in_.items():
         in_defs = v
         out_defs = out[l]
@@ -139,18 +228,32 @@ def main(program: dict) -> dict:
 
 
 
-
-    return program
-
+def print_stats(stats: Counter):
+    for key in ('iterations', 'transfers', 'merges'):
+        print(f'{key:<14} {stats[key]}', file=sys.stderr)
+    for key in ('transfer_time', 'merge_time'):
+        print(f'{key:<14} {stats[key]:.6f} s', file=sys.stderr)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        with open(sys.argv[1], 'r') as f:
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', nargs='?')
+    parser.add_argument('-a', '--analysis', choices=ANALYSES,
+                        default='reaching')
+    parser.add_argument('-s', '--stats', action='store_true',
+                        help='print solver statistics to stderr')
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'r') as f:
             program = json.load(f)
     else:
         program = sys.stdin.read()
         program = json.loads(program)
 
-    program = main(program)
+    stats = Counter() if args.stats else None
+    program = main(program, args.analysis, stats)
+    if stats is not None:
+        print_stats(stats)
     # print(json.dumps(program))
\ No newline at end of file
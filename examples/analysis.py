@@ -0,0 +1,185 @@
+"""Cache analyses of Bril functions across the passes of a pipeline.
+
+An `AnalysisManager` computes each analysis of a function at most once
+and hands out the same result until a pass invalidates it. Analyses
+that depend only on the shape of the control-flow graph (dominators and
+their relatives) survive passes that rewrite instructions without
+touching labels or control flow: instead of being dropped, they are
+rechecked against the function's current shape the next time they are
+requested.
+
+Results are shared, so treat them as read-only.
+"""
+
+import functools
+from collections import Counter, namedtuple
+
+from cfg import CFG, TERMINATORS
+import df
+import dom
+
+# An analysis computes its result from a function and the manager (to
+# request the analyses it depends on). `shape` analyses depend only on
+# the control-flow graph's shape.
+Analysis = namedtuple('Analysis', ['compute', 'shape'])
+
+
+def cfg_shape(instrs):
+    """Summarize the control flow of an instruction list: its labels,
+    its terminators, and where runs of other instructions fall between
+    them. Two functions with the same shape have the same CFG, down to
+    the names of their blocks.
+    """
+    shape = []
+    in_run = False
+    for instr in instrs:
+        if 'label' in instr:
+            shape.append(instr['label'])
+            in_run = False
+        elif instr['op'] in TERMINATORS:
+            shape.append((instr['op'], tuple(instr.get('labels', ()))))
+            in_run = False
+        elif not in_run:
+            shape.append(None)
+            in_run = True
+    return tuple(shape)
+
+
+def _cfg(func, am):
+    cfg = CFG(func['instrs'])
+    cfg.add_entry()
+    cfg.add_terminators()
+    return cfg
+
+
+def _succ(func, am):
+    return am.get(func, 'cfg').succ_map()
+
+
+def _dom(func, am, engine='auto'):
+    cfg = am.get(func, 'cfg')
+    return dom.get_dom(am.get(func, 'succ'), cfg.blocks[cfg.entry].name,
+                       engine)
+
+
+def _dom_tree(func, am):
+    return dom.dom_tree(am.get(func, 'dom'))
+
+
+def _dom_front(func, am):
+    return dom.dom_fronts(am.get(func, 'dom'))
+
+
+def _live(func, am):
+    """Live variables at the start and end of every block, and between
+    instructions on demand (a `df.Facts`).
+    """
+    return df.facts(am.get(func, 'cfg'), df.ANALYSES['live'])
+
+
+def _defuse(func, am):
+    """Def-use chains: map every variable to the lists of its definition
+    and use sites, each a `(block name, index)` pair.
+    """
+    chains = {arg['name']: ([], []) for arg in func.get('args', [])}
+    for block in am.get(func, 'cfg'):
+        for i, instr in enumerate(block.instrs):
+            for arg in instr.get('args', []):
+                chains.setdefault(arg, ([], []))[1].append((block.name, i))
+            if 'dest' in instr:
+                chains.setdefault(instr['dest'], ([], []))[0].append(
+                    (block.name, i)
+                )
+    return chains
+
+
+ANALYSES = {
+    'cfg': Analysis(_cfg, shape=False),
+    'succ': Analysis(_succ, shape=True),
+    'dom': Analysis(_dom, shape=True),
+    'dom_tree': Analysis(_dom_tree, shape=True),
+    'dom_front': Analysis(_dom_front, shape=True),
+    'live': Analysis(_live, shape=False),
+    'defuse': Analysis(_defuse, shape=False),
+}
+
+
+def with_dom_engine(engine):
+    """Get the analyses, with dominators computed by a particular engine
+    (see `dominance.ENGINES`).
+    """
+    return dict(ANALYSES, dom=Analysis(
+        functools.partial(_dom, engine=engine), shape=True,
+    ))
+
+
+class AnalysisManager:
+    """Memoize analyses per function (by name).
+
+    `stats` counts, for each analysis, how many times it was
+    `computed` and how many times a cached result was `reused`.
+    """
+
+    def __init__(self, analyses=ANALYSES):
+        self.analyses = analyses
+        self.stats = Counter()
+        self._results = {}
+        # The CFG shape that each function's shape analyses were
+        # computed for, and which of them need to be checked against it.
+        self._shapes = {}
+        self._unchecked = {}
+
+    def get(self, func, name):
+        """Get the result of an analysis for a function, computing it if
+        there is no valid cached result.
+        """
+        fname = func['name']
+        results = self._results.setdefault(fname, {})
+        if fname in self._unchecked:
+            self._recheck(func, results)
+
+        if name in results:
+            self.stats[name, 'reused'] += 1
+        else:
+            if self.analyses[name].shape and fname not in self._shapes:
+                self._shapes[fname] = cfg_shape(func['instrs'])
+            results[name] = self.analyses[name].compute(func, self)
+            self.stats[name, 'computed'] += 1
+        return results[name]
+
+    def _recheck(self, func, results):
+        """Keep a function's unchecked shape analyses if its shape has
+        not changed since they were computed, or drop them otherwise.
+        """
+        fname = func['name']
+        unchecked = self._unchecked.pop(fname)
+        shape = cfg_shape(func['instrs'])
+        if shape == self._shapes[fname]:
+            return
+        for name in unchecked:
+            del results[name]
+        if any(self.analyses[name].shape for name in results):
+            self._shapes[fname] = shape
+        else:
+            del self._shapes[fname]
+
+    def invalidate(self, func=None, preserve=()):
+        """Invalidate the analyses of one function (or, by default, all of
+        them) after a pass, except for those listed in `preserve`. Pass
+        `preserve=True` to keep everything.
+
+        Analyses that depend only on the CFG's shape are not dropped
+        right away but rechecked when the function is next analyzed.
+        """
+        if preserve is True:
+            return
+        fnames = [func['name']] if func else list(self._results)
+        for fname in fnames:
+            results = self._results.get(fname, {})
+            for name in list(results):
+                if name in preserve:
+                    continue
+                if self.analyses[name].shape:
+                    self._unchecked.setdefault(fname, set()).add(name)
+                else:
+                    del results[name]
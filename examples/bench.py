@@ -0,0 +1,595 @@
+"""Benchmarks for the analysis infrastructure in this directory.
+
+Usage:
+
+    python3 bench.py cfg [BLOCKS]
+    python3 bench.py df [BLOCKS] [VARS]
+    python3 bench.py worklist [DEPTH]
+    python3 bench.py facts [BLOCKS] [INSTRS]
+    python3 bench.py incremental [BLOCKS] [EDITS]
+    python3 bench.py dom [SIZE]
+    python3 bench.py rename [SIZE] [VARS]
+
+Each mode builds synthetic Bril functions and reports how long the
+current implementation takes, next to the code it replaced.
+"""
+
+import collections
+import gc
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+import cfg
+import df
+import dominance
+import gen_cfg
+import traverse
+from form_blocks import form_blocks
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'bril-txt'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+import briltxt  # noqa: E402
+import bril_opt  # noqa: E402
+
+
+def gen_func(nblocks, seed=0, nvars=1, span=None):
+    """Generate a Bril function with `nblocks` basic blocks. Each block
+    adds two random variables out of `nvars` into a third, and then
+    branches to a random block, jumps to the next one, or falls through.
+    With a `span`, branches only go forward, at most `span` blocks, or
+    back to the block itself, so every loop is a single block.
+    """
+    rng = random.Random(seed)
+    names = ['x'] + ['v{}'.format(i) for i in range(1, nvars)]
+    instrs = [{'op': 'const', 'dest': name, 'type': 'int', 'value': 1}
+              for name in names]
+    for i in range(nblocks):
+        instrs.append({'label': 'l{}'.format(i)})
+        instrs.append({'op': 'add', 'dest': rng.choice(names), 'type': 'int',
+                       'args': [rng.choice(names), rng.choice(names)]})
+        choice = rng.random()
+        if i == nblocks - 1:
+            instrs.append({'op': 'ret', 'args': []})
+        elif choice < 0.4:
+            instrs.append({'op': 'lt', 'dest': 'c', 'type': 'bool',
+                           'args': ['x', 'x']})
+            if span is None:
+                target = 'l{}'.format(rng.randrange(nblocks))
+            else:
+                target = 'l{}'.format(
+                    rng.randrange(i, min(nblocks, i + span + 1)))
+            instrs.append({'op': 'br', 'args': ['c'],
+                           'labels': [target, 'l{}'.format(i + 1)]})
+        elif choice < 0.7:
+            instrs.append({'op': 'jmp', 'labels': ['l{}'.format(i + 1)]})
+    return {'name': 'main', 'instrs': instrs}
+
+
+def gen_loops(depth):
+    """Generate a Bril function with `depth` nested loops. Each loop's
+    body defines a variable that the loop around it uses after the inner
+    loop exits, so facts have to travel through the whole nest.
+    """
+    instrs = [{'op': 'const', 'dest': 'c', 'type': 'bool', 'value': True}]
+    for i in range(depth):
+        instrs += [
+            {'label': 'h{}'.format(i)},
+            {'op': 'br', 'args': ['c'],
+             'labels': ['b{}'.format(i), 'e{}'.format(i)]},
+            {'label': 'b{}'.format(i)},
+            {'op': 'const', 'dest': 'v{}'.format(i), 'type': 'int',
+             'value': i},
+        ]
+    for i in reversed(range(depth)):
+        instrs.append({'label': 'e{}'.format(i)})
+        if i:
+            instrs += [
+                {'op': 'print', 'args': ['v{}'.format(i - 1)]},
+                {'op': 'jmp', 'labels': ['h{}'.format(i - 1)]},
+            ]
+    return {'name': 'main', 'instrs': instrs}
+
+
+def fifo_worklist(graph, analysis, stats=None):
+    """The previous solver: a FIFO worklist, seeded in layout order, that
+    queues successors even when they are already queued.
+    """
+    if analysis.forward:
+        in_edges, out_edges = graph.preds, graph.succs
+    else:
+        in_edges, out_edges = graph.succs, graph.preds
+    out = [analysis.init] * len(graph.blocks)
+    queue = collections.deque(graph.order)
+    while queue:
+        node = queue.popleft()
+        if stats is not None:
+            stats['transfers'] += 1
+        inval = analysis.merge(out[n] for n in in_edges[node])
+        outval = analysis.transfer(graph.blocks[node].instrs, inval)
+        if outval != out[node]:
+            out[node] = outval
+            queue.extend(out_edges[node])
+
+
+def build_block_map(func):
+    """The previous way to build a CFG: a name-keyed block map plus
+    separate predecessor and successor maps.
+    """
+    blocks = cfg.block_map(form_blocks(func['instrs']))
+    cfg.add_terminators(blocks)
+    return cfg.edges(blocks)
+
+
+def build_cfg(func):
+    graph = cfg.CFG(func['instrs'])
+    graph.add_terminators()
+    return graph
+
+
+def uncached_rpo(graph):
+    graph._rpo = None
+    return graph.rpo()
+
+
+def timed(func, arg, repeat=3):
+    """Return the best time to run `func(arg)` over `repeat` runs. Like
+    `timeit`, turn off the garbage collector while it runs.
+    """
+    best = None
+    for _ in range(repeat):
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            func(arg)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(name, nblocks, elapsed, baseline=None):
+    line = '{:<10} {:>10.3f} s {:>12.0f} blocks/s'.format(
+        name, elapsed, nblocks / elapsed,
+    )
+    if baseline is not None:
+        line += '  ({:.1f}x)'.format(baseline / elapsed)
+    print(line)
+
+
+def bench_cfg(nblocks=100000):
+    # Both builders add terminators to the blocks, so each run gets a
+    # fresh copy of the function.
+    funcs = [gen_func(nblocks) for _ in range(3)]
+    print('{} blocks, {} instructions'.format(
+        nblocks, len(funcs[0]['instrs']),
+    ))
+
+    before = timed(lambda _: build_block_map(funcs.pop()), None)
+    report('block_map', nblocks, before)
+    funcs = [gen_func(nblocks) for _ in range(3)]
+    after = timed(lambda _: build_cfg(funcs.pop()), None)
+    report('CFG', nblocks, after, before)
+
+    graph = build_cfg(gen_func(nblocks))
+    report('rpo', nblocks, timed(uncached_rpo, graph))
+
+
+def bench_df(nblocks=10000, nvars=100):
+    """Solve the `defined` and `live` analyses with the set-based and the
+    bit-vector engines.
+    """
+    graph = build_cfg(gen_func(nblocks, nvars=nvars))
+    print('{} blocks, {} variables'.format(nblocks, nvars))
+    for name in ('defined', 'live'):
+        analysis = df.ANALYSES[name]
+        as_sets = df.as_sets(analysis, graph)
+        before = timed(lambda g: df.df_worklist(g, as_sets), graph)
+        report(name + '-set', nblocks, before)
+        after = timed(lambda g: df.bitvector_worklist(g, analysis), graph)
+        report(name + '-bit', nblocks, after, before)
+
+
+def bench_worklist(depth=100, nblocks=2000):
+    """Solve set-based analyses with the FIFO and the priority worklists,
+    over a deep loop nest and over a random CFG, and count the transfer
+    function calls.
+    """
+    graphs = (
+        ('{} nested loops'.format(depth), build_cfg(gen_loops(depth))),
+        ('random CFG', build_cfg(gen_func(nblocks, nvars=20))),
+    )
+    for title, graph in graphs:
+        print('{}, {} blocks'.format(title, len(graph)))
+        for name in ('defined', 'live', 'cprop'):
+            analysis = df.ANALYSES[name]
+            if isinstance(analysis, df.BitAnalysis):
+                analysis = df.as_sets(analysis, graph)
+            before = None
+            for label, solver in (('fifo', fifo_worklist),
+                                  ('rpo', df.df_worklist)):
+                stats = collections.Counter()
+                solver(graph, analysis, stats)
+                elapsed = timed(lambda g: solver(g, analysis), graph)
+                line = '{:<14} {:>8.3f} s {:>8} transfers'.format(
+                    name + '-' + label, elapsed, stats['transfers'],
+                )
+                if before is None:
+                    before = elapsed
+                else:
+                    line += '  ({:.1f}x)'.format(before / elapsed)
+                print(line)
+
+
+def rescan_live_after(graph, out, block, index):
+    """The previous way to find the variables live after an instruction:
+    walk back from the end of its block.
+    """
+    live = set(out[block])
+    for instr in reversed(graph[block].instrs[index + 1:]):
+        live -= {instr['dest']} if 'dest' in instr else set()
+        live.update(instr.get('args', ()))
+    return live
+
+
+def bench_facts(nblocks=1000, ninstrs=50):
+    """Ask for the variables live after every instruction of a function
+    with `ninstrs` instructions per block, by rescanning each block and
+    with `df.Facts`.
+    """
+    func = gen_func(nblocks, nvars=20)
+    instrs = []
+    for instr in func['instrs']:
+        instrs += [instr] * (ninstrs if instr.get('op') == 'add' else 1)
+    func['instrs'] = [dict(instr) for instr in instrs]
+    graph = build_cfg(func)
+    queries = [(block.name, i) for block in graph
+               for i in range(len(block.instrs))]
+    print('{} blocks, {} queries'.format(nblocks, len(queries)))
+
+    def rescan(graph):
+        _, out = df.solve(graph, df.ANALYSES['live'])
+        for block, i in queries:
+            rescan_live_after(graph, out, block, i)
+
+    def lazy(graph):
+        facts = df.facts(graph, df.ANALYSES['live'])
+        for block, i in queries:
+            facts.at(block, i + 1)
+
+    before = timed(rescan, graph)
+    report('rescan', nblocks, before)
+    report('facts', nblocks, timed(lazy, graph), before)
+
+
+def bench_incremental(nblocks=10000, nedits=20):
+    """Delete an instruction from a few random blocks, one at a time,
+    and bring the live variables up to date after each deletion, from
+    scratch and with `df.IncrementalSolver`. The function's loops are
+    small, so an update usually stops after a few of them.
+    """
+    rng = random.Random(0)
+    analysis = df.ANALYSES['live']
+    print('{} blocks, {} edits'.format(nblocks, nedits))
+
+    def edit_all(update):
+        graph = build_cfg(gen_func(nblocks, nvars=20, span=8))
+        solver = df.IncrementalSolver(graph, analysis)
+        rng.seed(0)
+        for _ in range(nedits):
+            block = graph.blocks[rng.randrange(nblocks)]
+            del block.instrs[0]
+            update(graph, solver, block.id)
+        return solver.result()
+
+    def from_scratch(graph, solver, block_id):
+        solver.__init__(graph, analysis)
+
+    def incremental(graph, solver, block_id):
+        solver.update([block_id])
+
+    assert edit_all(from_scratch) == edit_all(incremental)
+    before = timed(lambda _: edit_all(from_scratch), None)
+    report('scratch', nblocks * nedits, before)
+    after = timed(lambda _: edit_all(incremental), None)
+    report('incremental', nblocks * nedits, after, before)
+
+
+def check_dom_index(d, name):
+    """Check the constant-time dominance queries and the frontiers of a
+    `Dominance` against the chains of immediate dominators.
+    """
+    doms = [d.dominators(node) for node in range(len(d.idom))]
+    for b, chain in enumerate(doms):
+        for a in range(len(d.idom)):
+            assert d.dominates(a, b) == (a in chain), \
+                'wrong dominates({}, {}) in @{}'.format(a, b, name)
+            common = None
+            for x, y in zip(chain, doms[a]):
+                if x != y:
+                    break
+                common = x
+            assert d.nearest_common_dominator(a, b) == common, \
+                'wrong nearest_common_dominator({}, {}) in @{}'.format(
+                    a, b, name)
+        assert sorted(d.dominated(b)) == \
+            [n for n, chain in enumerate(doms) if b in chain], \
+            'wrong dominated({}) in @{}'.format(b, name)
+        # `b` is in the frontier of the nodes that dominate one of its
+        # predecessors but do not strictly dominate it.
+        expected = {a for p in d.preds[b] for a in doms[p]
+                    if not (a in doms[b] and a != b)}
+        assert {a for a, front in enumerate(d.frontiers())
+                if b in front} == expected, \
+            'wrong frontiers of {} in @{}'.format(b, name)
+
+
+def bench_dom(max_size=300000):
+    """Check that the two dominator engines agree on the benchmark
+    programs and on generated CFGs of every shape, and that the dominator
+    tree's index answers queries correctly. Then time both engines on
+    growing CFGs, and find the size from which Lengauer-Tarjan wins.
+    """
+    pattern = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', 'benchmarks', '*', '*.bril')
+    funcs = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            funcs += briltxt.parse_prog(f.read())['functions']
+    funcs += [gen_cfg.gen_func(shape, size, seed=seed)
+              for shape in gen_cfg.SHAPES
+              for size in (10, 100, 1000)
+              for seed in range(3)]
+    for func in funcs:
+        graph = cfg.CFG(func['instrs'])
+        graph.add_entry()
+        rpo = graph.rpo()
+        chk = dominance.cooper_harvey_kennedy(graph.succs, graph.preds,
+                                              graph.entry, rpo)
+        lt = dominance.lengauer_tarjan(graph.succs, graph.preds,
+                                       graph.entry)
+        assert chk == lt, 'engines disagree on @{}'.format(func['name'])
+        if len(graph) <= 200:
+            check_dom_index(
+                dominance.Dominance(graph.succs, graph.preds, graph.entry),
+                func['name'],
+            )
+    print('{} functions: same dominator trees'.format(len(funcs)))
+
+    print('{:<12} {:>8} {:>10} {:>10} {:>10}'.format(
+        'shape', 'blocks', 'chk', 'lt', 'auto',
+    ))
+    wins = {}
+    for shape in gen_cfg.SHAPES:
+        size = 100
+        slow = False
+        while size <= max_size:
+            graph = cfg.CFG(gen_cfg.gen_func(shape, size)['instrs'])
+            graph.add_entry()
+            nblocks = len(graph)
+
+            def run(engine):
+                return dominance.Dominance(graph.succs, graph.preds,
+                                           graph.entry, engine)
+            # Stop timing `chk` once it gets slow.
+            chk = None if slow else timed(run, 'chk')
+            lt = timed(run, 'lt')
+            auto = timed(run, 'auto')
+            slow = chk is None or chk > 1
+            print('{:<12} {:>8} {:>10} {:>8.4f} s {:>8.4f} s'.format(
+                shape, nblocks,
+                '-' if chk is None else '{:.4f} s'.format(chk), lt, auto,
+            ))
+            if chk is None or lt < chk:
+                wins.setdefault(shape, nblocks)
+            else:
+                wins.pop(shape, None)
+            size *= 3
+    for shape in gen_cfg.SHAPES:
+        print('lt wins on {} from {}'.format(
+            shape, '{} blocks'.format(wins[shape]) if shape in wins
+            else 'no size tried',
+        ))
+
+
+def frontier_insert_phi_functions(globals_, definitions, dominators, blocks):
+    """The previous phi placement in `../to_ssa.py`, which gave a phi an
+    operand for each block whose frontier it is in, rather than for each
+    predecessor.
+    """
+    labels = dominators.names
+    frontiers = dominators.dominance.frontiers()
+    phis = [{} for _ in labels]
+    new_phis = [[] for _ in labels]
+    for var in globals_:
+        work_list = [dominators.index[label]
+                     for label in definitions.get(var, ())]
+        queued = set(work_list)
+        for block in work_list:
+            for frontier_block in frontiers[block]:
+                if frontier_block not in queued:
+                    queued.add(frontier_block)
+                    work_list.append(frontier_block)
+                phi_instr = phis[frontier_block].get(var)
+                if phi_instr is None:
+                    phi_instr = {'op': 'phi', 'dest': var, 'type': 'int',
+                                 'labels': [], 'args': []}
+                    phis[frontier_block][var] = phi_instr
+                    new_phis[frontier_block].append(phi_instr)
+                phi_instr['labels'].append(labels[block])
+                phi_instr['args'].append(var)
+
+    for block, added in enumerate(new_phis):
+        if added:
+            blocks[labels[block]].instrs[:0] = reversed(added)
+
+
+def list_stack_rename_ssa(blocks, globals_, dom_tree):
+    """The previous renaming in `../to_ssa.py`: version stacks pushed and
+    popped at the front of a list, and every operand split at the dot to
+    find its variable again.
+    """
+    counter = {}
+    stack = {}
+
+    def newname(n):
+        i = counter[n]
+        counter[n] += 1
+        stack[n].insert(0, i)
+        return f'{n}.{i}'
+
+    def rename_block(block):
+        for instr in block.instrs:
+            if 'op' in instr and instr['op'] == 'phi':
+                dest = instr['dest'].split('.')[0]
+                instr['dest'] = newname(dest)
+
+        for instr in block.instrs:
+            if 'op' in instr and instr['op'] == 'phi':
+                continue
+
+            if 'args' in instr:
+                for i, arg in enumerate(instr['args']):
+                    a = arg.split('.')[0]
+                    if a not in globals_:
+                        break
+                    instr['args'][i] = f'{a}.{stack[a][0]}'
+
+            if 'dest' in instr:
+                dest = instr['dest'].split('.')[0]
+                instr['dest'] = newname(dest)
+
+        for successor_label in block.successors:
+            successor = blocks[successor_label]
+
+            for instr in successor.instrs:
+                if 'op' in instr and instr['op'] == 'phi':
+                    for i, arg in enumerate(instr['args']):
+                        a = arg.split('.')[0]
+                        instr['args'][i] = f'{a}.{stack[a][0]}'
+                    dest = instr['dest'].split('.')[0]
+                    instr['dest'] = f'{dest}.{stack[dest][0]}'
+
+    def pop_block(block):
+        for instr in block.instrs:
+            if 'op' in instr and instr['op'] == 'phi':
+                dest = instr['dest'].split('.')[0]
+                stack[dest].pop(0)
+
+            elif 'dest' in instr:
+                dest = instr['dest'].split('.')[0]
+                stack[dest].pop(0)
+
+    for n in globals_:
+        counter[n] = 1
+        stack[n] = []
+
+    traverse.walk_tree(
+        blocks['entry'],
+        lambda block: [blocks[label] for label in dom_tree[block.label]],
+        rename_block, pop_block,
+    )
+
+
+def time_rename(insert, rename, text, repeat=10):
+    """Convert a function (given as JSON) to SSA with `../to_ssa.py`,
+    with `insert` placing the phis and `rename` renaming. Return the best
+    time the renaming took over `repeat` runs, and the renamed function
+    (without its phis).
+    """
+    top = bril_opt.load('to_ssa.py')
+    dominators_py = bril_opt.load('dominators.py')
+    best = None
+    for _ in range(repeat):
+        func = json.loads(text)
+        blocks = dominators_py.function_to_basic_blocks(func)
+        dominators = top.get_dominators(blocks)
+        globals_, definitions = top.get_globals(blocks)
+        insert(globals_, definitions, dominators, blocks)
+        dom_tree = top.get_dominance_tree(dominators)
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            rename(blocks, globals_, dom_tree)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, func
+
+
+def bench_rename(size=20000, nvars=200):
+    """Time SSA renaming in `../to_ssa.py` against the renaming it
+    replaced: over the functions in the benchmark programs (the ones the
+    old renaming could handle), and on a generated function of each
+    shape. Each renaming runs on the phis it was written for.
+    """
+    top = bril_opt.load('to_ssa.py')
+    before_ssa = (frontier_insert_phi_functions, list_stack_rename_ssa)
+    after_ssa = (top.insert_phi_functions, top.rename_ssa)
+    pattern = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', 'benchmarks', '*', '*.bril')
+    before = after = 0.0
+    count = failed = 0
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            funcs = briltxt.parse_prog(f.read())['functions']
+        for func in funcs:
+            text = json.dumps(func)
+            try:
+                old, expected = time_rename(*before_ssa, text)
+            except (IndexError, KeyError):
+                # Function arguments had no name on the stacks, or the
+                # first block was not called `entry`.
+                failed += 1
+                continue
+            new, actual = time_rename(*after_ssa, text)
+            assert actual == expected, 'different names in @{} in {}'.format(
+                func['name'], path)
+            before += old
+            after += new
+            count += 1
+    print('{} benchmark functions ({} more failed before): {:.4f} s -> '
+          '{:.4f} s ({:.1f}x)'.format(count, failed, before, after,
+                                      before / after))
+
+    print('{:<12} {:>8} {:>10} {:>10}'.format('shape', 'instrs', 'before',
+                                              'after'))
+    for shape in gen_cfg.SHAPES:
+        text = json.dumps(gen_cfg.gen_func(shape, size, nvars))
+        old, expected = time_rename(*before_ssa, text, 1)
+        new, actual = time_rename(*after_ssa, text, 1)
+        assert actual == expected, 'different names in {}'.format(shape)
+        print('{:<12} {:>8} {:>8.3f} s {:>8.3f} s  ({:.1f}x)'.format(
+            shape, size, old, new, old / new,
+        ))
+
+
+MODES = {
+    'cfg': bench_cfg,
+    'df': bench_df,
+    'worklist': bench_worklist,
+    'facts': bench_facts,
+    'incremental': bench_incremental,
+    'dom': bench_dom,
+    'rename': bench_rename,
+}
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in MODES:
+        print('usage: {} {{{}}} [ARGS ...]'.format(
+            sys.argv[0], ','.join(MODES),
+        ), file=sys.stderr)
+        sys.exit(1)
+    MODES[sys.argv[1]](*(int(a) for a in sys.argv[2:]))
+
+
+if __name__ == '__main__':
+    main()
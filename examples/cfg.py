@@ -1,6 +1,7 @@
 from collections import OrderedDict
 from util import fresh, flatten
-from form_blocks import TERMINATORS
+from form_blocks import form_blocks, TERMINATORS
+from traverse import reverse_postorder
 
 
 def block_map(blocks):
@@ -49,20 +50,21 @@ def add_terminators(blocks):
     """Given an ordered block map, modify the blocks to add terminators
     to all blocks (avoiding "fall-through" control flow transfers).
     """
+    names = list(blocks.keys())
     for i, block in enumerate(blocks.values()):
         if not block:
             if i == len(blocks) - 1:
                 # In the last block, return.
                 block.append({'op': 'ret', 'args': []})
             else:
-                dest = list(blocks.keys())[i + 1]
+                dest = names[i + 1]
                 block.append({'op': 'jmp', 'labels': [dest]})
         elif block[-1]['op'] not in TERMINATORS:
             if i == len(blocks) - 1:
                 block.append({'op': 'ret', 'args': []})
             else:
                 # Otherwise, jump to the next block.
-                dest = list(blocks.keys())[i + 1]
+                dest = names[i + 1]
                 block.append({'op': 'jmp', 'labels': [dest]})
 
 
@@ -111,3 +113,252 @@ def reassemble(blocks):
         instrs.append({'label': name})
         instrs += block
     return instrs
+
+
+class Block:
+    """A basic block in a `CFG`.
+
+    `instrs` is the block's instruction list, without the label that
+    starts it in the function. `label` is that label instruction, if the
+    block had one, so reassembling the function can reuse it.
+    """
+    __slots__ = ('id', 'name', 'instrs', 'label')
+
+    def __init__(self, id, name, instrs, label=None):
+        self.id = id
+        self.name = name
+        self.instrs = instrs
+        self.label = label
+
+    def __repr__(self):
+        return 'Block({}, {!r})'.format(self.id, self.name)
+
+
+class CFG:
+    """The control-flow graph of a Bril function.
+
+    Blocks are numbered with integer IDs, in order of creation, and
+    `blocks[id]` is the `Block` with that ID. The edges are adjacency
+    lists indexed by ID: `succs[id]` and `preds[id]` list the IDs of a
+    block's successors and predecessors. `index` maps block names to IDs
+    and `order` lists the IDs in layout order, which starts with the
+    entry block.
+
+    A block that does not end in a terminator falls through to the next
+    block in the layout (or returns, if it is the last one). The edges
+    include these fall-through transfers, but the instructions only get
+    explicit terminators from `add_terminators`.
+    """
+
+    def __init__(self, instrs=()):
+        self.blocks = []
+        self.order = []
+        self.succs = []
+        self.preds = []
+        self.index = {}
+        self._fresh_counts = {}
+        self._rpo = None
+
+        # Name the labeled blocks first, so the generated names for the
+        # anonymous blocks cannot clash with labels that appear later.
+        blocks = self.blocks
+        index = self.index
+        anonymous = []
+        for instrs in form_blocks(instrs):
+            block_id = len(blocks)
+            first = instrs[0]
+            if 'label' in first:
+                name = first['label']
+                index[name] = block_id
+                blocks.append(Block(block_id, name, instrs[1:], first))
+            else:
+                anonymous.append(block_id)
+                blocks.append(Block(block_id, None, instrs))
+        for block_id in anonymous:
+            name = self.fresh('b')
+            blocks[block_id].name = name
+            index[name] = block_id
+
+        nblocks = len(blocks)
+        self.order = list(range(nblocks))
+        self.succs = succs = [[] for _ in range(nblocks)]
+        self.preds = preds = [[] for _ in range(nblocks)]
+        for block in blocks:
+            src = block.id
+            last = block.instrs[-1] if block.instrs else {}
+            op = last.get('op')
+            if op in ('jmp', 'br'):
+                for label in last['labels']:
+                    dest = index[label]
+                    succs[src].append(dest)
+                    preds[dest].append(src)
+            elif op != 'ret' and src + 1 < nblocks:
+                # Fall through to the next block.
+                succs[src].append(src + 1)
+                preds[src + 1].append(src)
+
+    def _append(self, name, instrs, label=None):
+        block_id = len(self.blocks)
+        self.blocks.append(Block(block_id, name, instrs, label))
+        self.order.append(block_id)
+        self.succs.append([])
+        self.preds.append([])
+        if name is not None:
+            self.index[name] = block_id
+        return block_id
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        """Iterate over the blocks in layout order.
+        """
+        return (self.blocks[i] for i in self.order)
+
+    def __getitem__(self, name):
+        """Get a block by name.
+        """
+        return self.blocks[self.index[name]]
+
+    @property
+    def entry(self):
+        return self.order[0]
+
+    def fresh(self, seed):
+        """Generate a new block name starting with `seed`.
+        """
+        i = self._fresh_counts.get(seed, 0)
+        while True:
+            i += 1
+            name = seed + str(i)
+            if name not in self.index:
+                self._fresh_counts[seed] = i
+                return name
+
+    def rpo(self):
+        """Get the IDs of the blocks reachable from the entry in reverse
+        postorder. The order is cached until the graph changes.
+        """
+        if self._rpo is None:
+            self._rpo = reverse_postorder(self.succs, [self.entry])
+        return self._rpo
+
+    # Edits.
+
+    def _terminate(self, block_id):
+        """Make a block's fall-through transfer explicit.
+        """
+        instrs = self.blocks[block_id].instrs
+        if instrs and instrs[-1].get('op') in TERMINATORS:
+            return
+        if self.succs[block_id]:
+            dest = self.blocks[self.succs[block_id][0]].name
+            instrs.append({'op': 'jmp', 'labels': [dest]})
+        else:
+            instrs.append({'op': 'ret', 'args': []})
+
+    def add_terminators(self):
+        """Give every block an explicit terminator.
+        """
+        for block_id in self.order:
+            self._terminate(block_id)
+
+    def add_edge(self, src, dest):
+        self.succs[src].append(dest)
+        self.preds[dest].append(src)
+        self._rpo = None
+
+    def remove_edge(self, src, dest):
+        self.succs[src].remove(dest)
+        self.preds[dest].remove(src)
+        self._rpo = None
+
+    def add_block(self, name=None, instrs=None, succ=None):
+        """Add a new block at the end of the layout and return its ID.
+
+        If `succ` is an ID, the new block jumps there; otherwise, it
+        returns.
+        """
+        if self.order:
+            self._terminate(self.order[-1])
+        block_id = self._append(name or self.fresh('b'), instrs or [])
+        if succ is not None:
+            self.add_edge(block_id, succ)
+        self._terminate(block_id)
+        self._rpo = None
+        return block_id
+
+    def add_entry(self):
+        """Ensure that the CFG has a unique entry block with no
+        predecessors, like the `add_entry` function.
+        """
+        old_entry = self.entry
+        if not self.preds[old_entry]:
+            return
+        block_id = self._append(self.fresh('entry'), [])
+        self.order.pop()
+        self.order.insert(0, block_id)
+        self.add_edge(block_id, old_entry)
+
+    def retarget(self, src, old, new):
+        """Redirect the control-flow edges from `src` to `old` so they go
+        to `new`, updating `src`'s terminator.
+        """
+        self._terminate(src)
+        term = self.blocks[src].instrs[-1]
+        old_name = self.blocks[old].name
+        term['labels'] = [self.blocks[new].name if label == old_name
+                          else label for label in term['labels']]
+        while old in self.succs[src]:
+            self.remove_edge(src, old)
+            self.add_edge(src, new)
+
+    def split_edge(self, src, dest, name=None):
+        """Insert a new, empty block on the edge from `src` to `dest` and
+        return its ID.
+        """
+        block_id = self.add_block(name, succ=dest)
+        self.retarget(src, dest, block_id)
+        return block_id
+
+    def remove_block(self, block_id):
+        """Remove a block that has no predecessors, such as an
+        unreachable one.
+        """
+        if self.preds[block_id]:
+            raise ValueError('block {} has predecessors'.format(
+                self.blocks[block_id].name
+            ))
+        for succ in list(self.succs[block_id]):
+            self.remove_edge(block_id, succ)
+        self.order.remove(block_id)
+        del self.index[self.blocks[block_id].name]
+        self.blocks[block_id] = None
+
+    # Views by name, for code written against `block_map`.
+
+    def name_map(self):
+        """Get an `OrderedDict` mapping names to instruction lists, in
+        layout order. The lists are the blocks' own.
+        """
+        return OrderedDict((block.name, block.instrs) for block in self)
+
+    def succ_map(self):
+        return {block.name: [self.blocks[s].name for s in self.succs[block.id]]
+                for block in self}
+
+    def pred_map(self):
+        return {block.name: [self.blocks[p].name for p in self.preds[block.id]]
+                for block in self}
+
+    def reassemble(self):
+        """Flatten the CFG into an instruction list.
+        """
+        instrs = []
+        for block in self:
+            label = block.label
+            if label is None or label['label'] != block.name:
+                label = {'label': block.name}
+            instrs.append(label)
+            instrs += block.instrs
+        return instrs
@@ -0,0 +1,69 @@
+"""Dead code elimination using live variables.
+
+Delete every instruction whose result is not live after it, unless it
+has side effects. Deleting instructions can make the variables they read
+dead in turn, so this repeats until nothing changes. After each round,
+the liveness solution is only updated for the blocks that changed (see
+`df.IncrementalSolver`).
+
+With `-c`, check every update against solving liveness from scratch.
+"""
+
+import json
+import sys
+
+from cfg import CFG
+import df
+from util import set_instrs
+
+# Instructions with results that have to run anyway.
+EFFECT_OPS = {'call'}
+
+
+def dce_block(instrs, live):
+    """Delete the dead instructions in a block, given the variables live
+    at its end. Return whether anything changed.
+    """
+    live = set(live)
+    keep = []
+    for instr in reversed(instrs):
+        dest = instr.get('dest')
+        if dest is not None and dest not in live \
+                and instr['op'] not in EFFECT_OPS:
+            continue
+        keep.append(instr)
+        if dest is not None:
+            live.discard(dest)
+        live.update(instr.get('args', ()))
+    if len(keep) == len(instrs):
+        return False
+    instrs[:] = reversed(keep)
+    return True
+
+
+def func_dce(func, check=False):
+    cfg = CFG(func['instrs'])
+    solver = df.IncrementalSolver(cfg, df.ANALYSES['live'])
+    while True:
+        _, out = solver.result()
+        dirty = [block.id for block in cfg
+                 if dce_block(block.instrs, out[block.name])]
+        if not dirty:
+            break
+        solver.update(dirty)
+        if check:
+            expected = df.IncrementalSolver(cfg, df.ANALYSES['live'])
+            assert solver.result() == expected.result(), \
+                'incremental liveness differs in @{}'.format(func['name'])
+    set_instrs(func, cfg.reassemble())
+
+
+def dce(bril, check=False):
+    for func in bril['functions']:
+        func_dce(func, check)
+    return bril
+
+
+if __name__ == '__main__':
+    bril = dce(json.load(sys.stdin), '-c' in sys.argv)
+    print(json.dumps(bril, indent=2, sort_keys=True))
@@ -1,9 +1,11 @@
 import sys
 import json
-from collections import namedtuple
+import functools
+from collections import Counter, namedtuple, OrderedDict
 
-from form_blocks import form_blocks
-import cfg
+from cfg import CFG
+from parallel import jobs_flag, map_funcs
+import worklist
 
 # A single dataflow analysis consists of these part:
 # - forward: True for forward, False for backward.
@@ -12,6 +14,18 @@ import cfg
 # - transfer: The transfer function.
 Analysis = namedtuple('Analysis', ['forward', 'init', 'merge', 'transfer'])
 
+# A gen/kill analysis over sets of variables, which can be solved with
+# bit vectors:
+# - forward: True for forward, False for backward.
+# - meet: `union` or `intersection`, to combine values at merge points.
+# - gen: The variables a block adds to the set.
+# - kill: The variables a block removes from the set.
+# The transfer function is `gen(block) | (value - kill(block))`, and the
+# value coming into the entry (or exit) block is empty. Every other value
+# starts empty for `union` and as the set of all the function's variables
+# for `intersection`, so the solution is the most precise one.
+BitAnalysis = namedtuple('BitAnalysis', ['forward', 'meet', 'gen', 'kill'])
+
 
 def union(sets):
     out = set()
@@ -20,46 +34,380 @@ def union(sets):
     return out
 
 
-def df_worklist(blocks, analysis):
+def intersection(sets):
+    sets = list(sets)
+    if not sets:
+        return set()
+    out = set(sets[0])
+    for s in sets[1:]:
+        out &= s
+    return out
+
+
+def df_worklist(cfg, analysis, stats=None):
     """The worklist algorithm for iterating a data flow analysis to a
-    fixed point.
+    fixed point over a `cfg.CFG`.
+
+    Return the in and out values as maps from block names. If `stats` is
+    a `Counter`, add the solver's iteration counts to it (see
+    `worklist.iterate`).
     """
-    preds, succs = cfg.edges(blocks)
+    return IncrementalSolver(cfg, analysis, stats).result()
 
-    # Switch between directions.
-    if analysis.forward:
-        first_block = list(blocks.keys())[0]  # Entry.
-        in_edges = preds
-        out_edges = succs
+
+def variables(cfg):
+    """List the variables that a `cfg.CFG` reads or writes, in the order
+    they first appear.
+    """
+    names = {}
+    for block in cfg:
+        for instr in block.instrs:
+            for var in instr.get('args', ()):
+                names.setdefault(var)
+            if 'dest' in instr:
+                names.setdefault(instr['dest'])
+    return list(names)
+
+
+def as_sets(analysis, cfg):
+    """Turn a `BitAnalysis` into an equivalent set-based `Analysis` over
+    the variables of a `cfg.CFG`.
+    """
+    def transfer(block, val):
+        return analysis.gen(block) | (val - set(analysis.kill(block)))
+    if analysis.meet is union:
+        init = set()
     else:
-        first_block = list(blocks.keys())[-1]  # Exit.
-        in_edges = succs
-        out_edges = preds
+        init = set(variables(cfg))
+    return Analysis(analysis.forward, init, analysis.meet, transfer)
 
-    # Initialize.
-    in_ = {first_block: analysis.init}
-    out = {node: analysis.init for node in blocks}
 
-    # Iterate.
-    worklist = list(blocks.keys())
-    while worklist:
-        node = worklist.pop(0)
+class IncrementalSolver:
+    """Solve a data flow analysis over a `cfg.CFG` and keep the solution
+    up to date while a pass edits the CFG.
 
-        inval = analysis.merge(out[n] for n in in_edges[node])
-        in_[node] = inval
+    After an edit, call `update` with the IDs of the blocks whose
+    instructions or outgoing edges changed, and of any new blocks. Only
+    the blocks the edit can affect get solved again: those reachable,
+    in the direction of the analysis, from the changed blocks or their
+    former successors (predecessors, for a backward analysis). They are
+    solved one strongly connected component at a time, from scratch, so
+    the result is identical to solving the whole CFG again; and a
+    component whose inputs turn out not to have changed is skipped. A
+    `BitAnalysis` is solved with sets (see `as_sets`), over the variables
+    the CFG has when the solver is created.
+    """
+
+    def __init__(self, cfg, analysis, stats=None):
+        if isinstance(analysis, BitAnalysis):
+            analysis = as_sets(analysis, cfg)
+        self.cfg = cfg
+        self.analysis = analysis
+        # Values, by block ID, on the way into and out of each block, in
+        # the direction of the analysis.
+        self._in = {}
+        self._out = {}
+        # The out-edges each block had when it was last solved.
+        self._edges = {}
+        self._solve(worklist.cfg_order(cfg, analysis.forward), stats)
+
+    def _directed_edges(self):
+        if self.analysis.forward:
+            return self.cfg.preds, self.cfg.succs
+        else:
+            return self.cfg.succs, self.cfg.preds
+
+    def _solve(self, order, stats):
+        """Reset the blocks in `order` and solve them again, given the
+        values of all other blocks.
+        """
+        analysis = self.analysis
+        blocks = self.cfg.blocks
+        in_edges, out_edges = self._directed_edges()
+        in_ = self._in
+        out = self._out
+        for node in order:
+            out[node] = analysis.init
+
+        def visit(node):
+            inval = analysis.merge(out[n] for n in in_edges[node])
+            in_[node] = inval
 
-        outval = analysis.transfer(blocks[node], inval)
+            outval = analysis.transfer(blocks[node].instrs, inval)
+
+            if outval != out[node]:
+                out[node] = outval
+                return True
+            return False
+
+        worklist.iterate(order, out_edges, visit, stats)
+        for node in order:
+            self._edges[node] = list(out_edges[node])
+
+    def update(self, dirty, stats=None):
+        """Solve the analysis again after the blocks in `dirty` changed.
+        """
+        blocks = self.cfg.blocks
+        in_edges, out_edges = self._directed_edges()
+        seeds = set(dirty)
+        for node in dirty:
+            seeds.update(self._edges.get(node, ()))
+            if blocks[node] is not None:
+                seeds.update(out_edges[node])
+        seeds = {n for n in seeds if blocks[n] is not None}
+
+        # Forget removed blocks.
+        for node in list(self._out):
+            if blocks[node] is None:
+                del self._in[node], self._out[node], self._edges[node]
+
+        region = set()
+        stack = list(seeds)
+        while stack:
+            node = stack.pop()
+            if node not in region:
+                region.add(node)
+                stack.extend(out_edges[node])
+        order = [n for n in worklist.cfg_order(self.cfg,
+                                               self.analysis.forward)
+                 if n in region]
+        rank = {n: i for i, n in enumerate(order)}
+
+        changed = set()
+        for component in components(order, out_edges, region):
+            if not any(n in seeds or any(p in changed for p in in_edges[n])
+                       for n in component):
+                continue
+            old = {n: self._out.get(n) for n in component}
+            self._solve(sorted(component, key=rank.get), stats)
+            changed.update(n for n in component
+                           if n not in old or self._out[n] != old[n])
+
+    def result(self):
+        """Get the in and out values as maps from block names, like
+        `df_worklist`.
+        """
+        cfg = self.cfg
+        in_ = {cfg.blocks[n].name: self._in[n] for n in cfg.order}
+        out = {cfg.blocks[n].name: self._out[n] for n in cfg.order}
+        if self.analysis.forward:
+            return in_, out
+        else:
+            return out, in_
+
+
+def bitvector_worklist(cfg, analysis, stats=None):
+    """Solve a `BitAnalysis` over a `cfg.CFG`, like `df_worklist`.
+
+    The function's variables are numbered once, each block's gen and
+    kill sets are computed once as bit masks, and the iteration only
+    does bitwise operations on integers. The results are converted back
+    to sets of names.
+    """
+    # Number the variables.
+    names = variables(cfg)
+    bits = {var: 1 << i for i, var in enumerate(names)}
+
+    def mask(vars):
+        out = 0
+        for var in vars:
+            out |= bits[var]
+        return out
+
+    nblocks = len(cfg.blocks)
+    gen = [0] * nblocks
+    keep = [0] * nblocks
+    full = (1 << len(names)) - 1
+    for block in cfg:
+        gen[block.id] = mask(analysis.gen(block.instrs))
+        keep[block.id] = full & ~mask(analysis.kill(block.instrs))
+
+    if analysis.forward:
+        in_edges = cfg.preds
+        out_edges = cfg.succs
+    else:
+        in_edges = cfg.succs
+        out_edges = cfg.preds
+    meet_union = analysis.meet is union
+
+    # Start at the top of the lattice: nothing for a "may" analysis and
+    # everything for a "must" analysis.
+    in_ = [0] * nblocks
+    out = [0 if meet_union else full] * nblocks
+
+    def visit(node):
+        edges = in_edges[node]
+        if not edges:
+            inval = 0
+        elif meet_union:
+            inval = 0
+            for n in edges:
+                inval |= out[n]
+        else:
+            inval = full
+            for n in edges:
+                inval &= out[n]
+        in_[node] = inval
 
+        outval = gen[node] | (inval & keep[node])
         if outval != out[node]:
             out[node] = outval
-            worklist += out_edges[node]
+            return True
+        return False
+
+    # Iterate.
+    worklist.iterate(worklist.cfg_order(cfg, analysis.forward), out_edges,
+                     visit, stats)
+
+    # Many blocks tend to end up with the same value, so convert each
+    # distinct value once (and copy it, so the results stay independent).
+    sets = {}
+
+    def to_set(value):
+        if value not in sets:
+            bits = bin(value)[:1:-1]
+            sets[value] = {names[i] for i, bit in enumerate(bits)
+                           if bit == '1'}
+        return set(sets[value])
 
+    in_ = {cfg.blocks[n].name: to_set(in_[n]) for n in cfg.order}
+    out = {cfg.blocks[n].name: to_set(out[n]) for n in cfg.order}
     if analysis.forward:
         return in_, out
     else:
         return out, in_
 
 
+def solve(cfg, analysis, stats=None, bits=True):
+    """Solve either kind of analysis with the appropriate engine. With
+    `bits` false, a `BitAnalysis` is solved with sets by `df_worklist`.
+    """
+    if isinstance(analysis, BitAnalysis) and bits:
+        return bitvector_worklist(cfg, analysis, stats)
+    else:
+        return df_worklist(cfg, analysis, stats)
+
+
+def transfer_instr(analysis, instr, val):
+    """Apply either kind of analysis's transfer function to a single
+    instruction.
+    """
+    if isinstance(analysis, BitAnalysis):
+        return analysis.gen([instr]) | (val - set(analysis.kill([instr])))
+    else:
+        return analysis.transfer([instr], val)
+
+
+class Facts:
+    """The solution to a data flow analysis, which can also answer
+    queries about the points between instructions.
+
+    `in_` and `out` map block names to the values at the start and end
+    of each block, as returned by `solve`. `at(block, index)` gets the
+    value at the point just before instruction `index` in a block (so
+    index 0 is the start of the block and `len(instrs)` is its end). The
+    first query in a block replays `step(instr, value)` over the block's
+    instructions to find the values at all of its points, and those are
+    kept for the `cache_size` most recently queried blocks.
+
+    The answers are only valid until the instructions change.
+    """
+
+    def __init__(self, blocks, step, forward, in_, out, cache_size=64):
+        self.in_ = in_
+        self.out = out
+        self.cache_size = cache_size
+        self._blocks = blocks
+        self._step = step
+        self._forward = forward
+        self._points = OrderedDict()
+
+    def at(self, block, index):
+        points = self._points.get(block)
+        if points is None:
+            points = self._replay(block)
+            self._points[block] = points
+            if len(self._points) > self.cache_size:
+                self._points.popitem(last=False)
+        else:
+            self._points.move_to_end(block)
+        return points[index]
+
+    def _replay(self, block):
+        instrs = self._blocks[block]
+        if self._forward:
+            val = self.in_[block]
+        else:
+            val = self.out[block]
+            instrs = reversed(instrs)
+        points = [val]
+        for instr in instrs:
+            val = self._step(instr, val)
+            points.append(val)
+        if not self._forward:
+            points.reverse()
+        return points
+
+
+def facts(cfg, analysis, stats=None, bits=True):
+    """Solve an analysis (see `solve`) and wrap the result in a `Facts`.
+    """
+    in_, out = solve(cfg, analysis, stats, bits)
+    return Facts(
+        {block.name: block.instrs for block in cfg},
+        lambda instr, val: transfer_instr(analysis, instr, val),
+        analysis.forward, in_, out,
+    )
+
+
+def components(nodes, succs, within):
+    """Find the strongly connected components of the subgraph induced by
+    the set `within`, visiting `nodes` as roots in order. Return them in
+    topological order, as lists.
+    """
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    out = []
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(succs[root]))]
+        while work:
+            node, it = work[-1]
+            for succ in it:
+                if succ not in within:
+                    continue
+                if succ not in index:
+                    index[succ] = low[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(succs[succ])))
+                    break
+                elif succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    out.append(component)
+    out.reverse()
+    return out
+
+
 def fmt(val):
     """Guess a good way to format a data flow value. (Works for sets and
     dicts, at least.)
@@ -79,17 +427,38 @@ def fmt(val):
         return str(val)
 
 
-def run_df(bril, analysis):
-    for func in bril['functions']:
-        # Form the CFG.
-        blocks = cfg.block_map(form_blocks(func['instrs']))
-        cfg.add_terminators(blocks)
+def format_df(analysis, points, bits, func):
+    """Solve an analysis on one function and format the values at the
+    start and end of every block (and, with `points`, at the points
+    between its instructions). Return the text and the solver's stats.
+    """
+    # Form the CFG.
+    graph = CFG(func['instrs'])
+    graph.add_terminators()
+
+    stats = Counter()
+    result = facts(graph, analysis, stats, bits)
+    lines = []
+    for block in result.in_:
+        lines.append('{}:'.format(block))
+        lines.append('  in:  {}'.format(fmt(result.in_[block])))
+        if points:
+            for i in range(1, len(graph[block].instrs)):
+                lines.append('  [{}] {}'.format(i, fmt(result.at(block, i))))
+        lines.append('  out: {}'.format(fmt(result.out[block])))
+    return ''.join(line + '\n' for line in lines), stats
 
-        in_, out = df_worklist(blocks, analysis)
-        for block in blocks:
-            print('{}:'.format(block))
-            print('  in: ', fmt(in_[block]))
-            print('  out:', fmt(out[block]))
+
+def run_df(bril, analysis, stats=None, points=False, jobs=1, bits=True):
+    """Print the results of an analysis on every function, solving them
+    with `jobs` worker processes (see `parallel.map_funcs`).
+    """
+    report = functools.partial(format_df, analysis, points, bits)
+    for text, func_stats in map_funcs(report, bril['functions'], jobs,
+                                      inplace=False):
+        sys.stdout.write(text)
+        if stats is not None:
+            stats.update(func_stats)
 
 
 def gen(block):
@@ -98,6 +467,10 @@ def gen(block):
     return {i['dest'] for i in block if 'dest' in i}
 
 
+def nothing(block):
+    return set()
+
+
 def use(block):
     """Variables that are read before they are written in the block.
     """
@@ -139,20 +512,28 @@ def cprop_merge(vals_list):
 ANALYSES = {
     # A really really basic analysis that just accumulates all the
     # currently-defined variables.
-    'defined': Analysis(
+    'defined': BitAnalysis(
+        True,
+        meet=union,
+        gen=gen,
+        kill=nothing,
+    ),
+
+    # The variables that are defined on every path to a given point.
+    'initialized': BitAnalysis(
         True,
-        init=set(),
-        merge=union,
-        transfer=lambda block, in_: in_.union(gen(block)),
+        meet=intersection,
+        gen=gen,
+        kill=nothing,
     ),
 
     # Live variable analysis: the variables that are both defined at a
     # given point and might be read along some path in the future.
-    'live': Analysis(
+    'live': BitAnalysis(
         False,
-        init=set(),
-        merge=union,
-        transfer=lambda block, out: use(block).union(out - gen(block)),
+        meet=union,
+        gen=use,
+        kill=gen,
     ),
 
     # A simple constant propagation pass.
@@ -166,4 +547,5 @@ ANALYSES = {
 
 if __name__ == '__main__':
     bril = json.load(sys.stdin)
-    run_df(bril, ANALYSES[sys.argv[1]])
+    run_df(bril, ANALYSES[sys.argv[1]], points='-i' in sys.argv,
+           jobs=jobs_flag(sys.argv[1:]), bits='-s' not in sys.argv)
@@ -0,0 +1,415 @@
+"""Dominance, represented by immediate dominators.
+
+`Dominance` finds the immediate dominator of every node reachable from an
+entry, with one of two engines:
+
+* `chk`, the iterative algorithm of Cooper, Harvey, and Kennedy ("A
+  Simple, Fast Dominance Algorithm"). It sweeps the nodes in reverse
+  postorder until nothing changes, which is fast on typical CFGs but can
+  take many sweeps (or long walks up the tree) on big, tangled ones.
+* `lt`, the algorithm of Lengauer and Tarjan ("A Fast Algorithm for
+  Finding Dominators in a Flowgraph"), in its simple version with path
+  compression, which takes O(m log n) time on any graph.
+
+Both give the same result. In pure Python, `chk` is about twice as fast
+on most CFGs, but wide branch cascades make its walks up the tree
+quadratic (see `bench.py dom`). So by default (`auto`), `chk` runs until
+it has walked `AUTO_STEPS` times as many steps as the graph has edges,
+and then `lt` takes over.
+
+Nodes are integer IDs and edges are adjacency lists indexed by ID, like
+in `cfg.CFG`. Rather than keeping the set of dominators of every node,
+which takes quadratic space on deep CFGs, `Dominance` keeps one `idom`
+array and derives everything else from it: the dominators of a node (the
+chain of immediate dominators up to the entry), the dominator tree,
+dominance frontiers, and iterated dominance frontiers (where phi-nodes
+go).
+
+The dominator tree is also numbered in depth-first preorder and
+postorder, so that checking whether one node dominates another takes
+constant time (a node's descendants are numbered inside its interval),
+and finding the nearest common dominator of two nodes takes logarithmic
+time.
+
+Unreachable nodes have no dominators, not even themselves, and are left
+out of the tree and the frontiers.
+"""
+
+from collections.abc import Mapping
+
+import traverse
+
+# How many steps up the tree, per edge, `auto` lets `chk` take.
+AUTO_STEPS = 16
+
+
+def cooper_harvey_kennedy(succs, preds, entry, rpo, max_steps=None):
+    """Find the immediate dominators of the nodes in `rpo`, the nodes
+    reachable from `entry` in reverse postorder. Return a list with the
+    immediate dominator of every node, or None.
+
+    Give up and return None after `max_steps` steps up the tree.
+    """
+    number = [-1] * len(succs)
+    for i, node in enumerate(rpo):
+        number[node] = i
+    steps = 0
+
+    def intersect(a, b):
+        # Walk up from both nodes to their nearest common dominator.
+        nonlocal steps
+        while a != b:
+            while number[a] > number[b]:
+                a = idom[a]
+                steps += 1
+            while number[b] > number[a]:
+                b = idom[b]
+                steps += 1
+        return a
+
+    # Until it is done, the entry is its own immediate dominator, and
+    # None marks nodes that have not been reached yet.
+    idom = [None] * len(succs)
+    idom[entry] = entry
+    changed = True
+    while changed:
+        changed = False
+        for node in rpo[1:]:
+            new = None
+            for pred in preds[node]:
+                if idom[pred] is None:
+                    continue
+                new = pred if new is None else intersect(pred, new)
+                if max_steps is not None and steps > max_steps:
+                    return None
+            if idom[node] != new:
+                idom[node] = new
+                changed = True
+    idom[entry] = None
+    return idom
+
+
+def lengauer_tarjan(succs, preds, entry, rpo=None):
+    """Find the immediate dominators of the nodes reachable from `entry`.
+    Return a list with the immediate dominator of every node, or None.
+    """
+    # Number the reachable nodes in depth-first preorder. Everything
+    # below works on these numbers.
+    dfnum = [-1] * len(succs)
+    vertex = []
+    parent = []
+    stack = [(entry, -1)]
+    while stack:
+        node, par = stack.pop()
+        if dfnum[node] >= 0:
+            continue
+        dfnum[node] = len(vertex)
+        vertex.append(node)
+        parent.append(par)
+        for succ in reversed(succs[node]):
+            if dfnum[succ] < 0:
+                stack.append((succ, dfnum[node]))
+
+    n = len(vertex)
+    semi = list(range(n))
+    idom = [0] * n
+    # The forest of processed nodes, with path compression: `label[v]`
+    # is the node with the smallest semidominator on the path from `v`
+    # up to (but not including) the root of its tree.
+    ancestor = [-1] * n
+    label = list(range(n))
+    bucket = [[] for _ in range(n)]
+
+    def evaluate(v):
+        if ancestor[v] < 0:
+            return v
+        # Compress the path from `v` to the root of its tree, starting
+        # near the root.
+        path = []
+        while ancestor[ancestor[v]] >= 0:
+            path.append(v)
+            v = ancestor[v]
+        for v in reversed(path):
+            a = ancestor[v]
+            if semi[label[a]] < semi[label[v]]:
+                label[v] = label[a]
+            ancestor[v] = ancestor[a]
+        return label[path[0]] if path else label[v]
+
+    for w in range(n - 1, 0, -1):
+        # The semidominator comes from the predecessors.
+        for pred in preds[vertex[w]]:
+            v = dfnum[pred]
+            if v < 0:
+                continue  # Unreachable.
+            u = evaluate(v)
+            if semi[u] < semi[w]:
+                semi[w] = semi[u]
+        bucket[semi[w]].append(w)
+
+        # Link the node into the forest, and settle the nodes whose
+        # semidominator is its parent.
+        p = parent[w]
+        ancestor[w] = p
+        for v in bucket[p]:
+            u = evaluate(v)
+            idom[v] = u if semi[u] < semi[v] else p
+        bucket[p] = []
+
+    for w in range(1, n):
+        if idom[w] != semi[w]:
+            idom[w] = idom[idom[w]]
+
+    out = [None] * len(succs)
+    for w in range(1, n):
+        out[vertex[w]] = vertex[idom[w]]
+    return out
+
+
+ENGINES = {
+    'chk': cooper_harvey_kennedy,
+    'lt': lengauer_tarjan,
+}
+
+
+class Dominance:
+    """The dominance relation of a graph, given its successor and
+    predecessor lists and an entry node. `engine` is `auto`, `chk`, or
+    `lt`.
+
+    `idom[node]` is the immediate dominator of a node, or None for the
+    entry and unreachable nodes. `rpo` lists the reachable nodes in
+    reverse postorder, and `number[node]` is a node's position in it (or
+    -1 if it is unreachable).
+
+    `preorder` lists the reachable nodes in a depth-first preorder of the
+    dominator tree. `pre[node]` and `post[node]` are a node's position in
+    that preorder and in the matching postorder, and `depth[node]` is its
+    depth in the tree (all -1 if it is unreachable).
+    """
+
+    def __init__(self, succs, preds, entry, engine='auto'):
+        self.entry = entry
+        self.preds = preds
+        self.rpo = traverse.reverse_postorder(succs, [entry])
+        self.number = number = [-1] * len(succs)
+        for i, node in enumerate(self.rpo):
+            number[node] = i
+
+        self.idom = None
+        if engine == 'auto':
+            edges = sum(len(preds[node]) for node in self.rpo)
+            engine = 'chk'
+            self.idom = cooper_harvey_kennedy(
+                succs, preds, entry, self.rpo, AUTO_STEPS * (edges + 1),
+            )
+            if self.idom is None:
+                engine = 'lt'
+        self.engine = engine
+        if self.idom is None:
+            self.idom = ENGINES[engine](succs, preds, entry, self.rpo)
+
+        self._children = [[] for _ in self.idom]
+        for node in self.rpo[1:]:
+            self._children[self.idom[node]].append(node)
+        self._number_tree()
+        self._jumps = None
+        self._frontiers = None
+
+    def _number_tree(self):
+        # Walk the dominator tree depth-first, with an explicit stack (the
+        # tree is as deep as the CFG is long).
+        children = self._children
+        idom = self.idom
+        self.preorder = preorder = []
+        self.pre = pre = [-1] * len(idom)
+        self.depth = depth = [-1] * len(idom)
+        depth[self.entry] = 0
+        stack = [self.entry]
+        while stack:
+            node = stack.pop()
+            pre[node] = len(preorder)
+            preorder.append(node)
+            kids = children[node]
+            if kids:
+                below = depth[node] + 1
+                for child in kids:
+                    depth[child] = below
+                stack.extend(reversed(kids))
+
+        # A node's subtree follows it in preorder. Before it starts, every
+        # node numbered earlier except its ancestors has finished, so its
+        # postorder number is `pre - depth + size - 1`.
+        size = [1] * len(idom)
+        for node in reversed(preorder):
+            if idom[node] is not None:
+                size[idom[node]] += size[node]
+        self.post = post = [-1] * len(idom)
+        for node in preorder:
+            post[node] = pre[node] - depth[node] + size[node] - 1
+
+    def reachable(self, node):
+        return self.number[node] >= 0
+
+    def dominators(self, node):
+        """List the dominators of a node, from the entry down to the node
+        itself.
+        """
+        if not self.reachable(node):
+            return []
+        chain = []
+        idom = self.idom
+        while node is not None:
+            chain.append(node)
+            node = idom[node]
+        chain.reverse()
+        return chain
+
+    def dominates(self, a, b):
+        """Check whether `a` dominates `b` (every node dominates itself).
+        """
+        # `a` is an ancestor of `b` in the tree if it comes before `b` in
+        # preorder and after it in postorder.
+        return (self.pre[b] >= 0 and self.pre[a] >= 0
+                and self.pre[a] <= self.pre[b]
+                and self.post[b] <= self.post[a])
+
+    def strictly_dominates(self, a, b):
+        return a != b and self.dominates(a, b)
+
+    def dominated(self, node):
+        """List the nodes that a node dominates, itself first, in the
+        dominator tree's preorder.
+        """
+        if not self.reachable(node):
+            return []
+        # The nodes below `node` follow it in preorder (see
+        # `_number_tree`).
+        start = self.pre[node]
+        size = self.post[node] - start + self.depth[node] + 1
+        return self.preorder[start:start + size]
+
+    def nearest_common_dominator(self, a, b):
+        """Find the deepest node that dominates both `a` and `b`, or None
+        if either is unreachable.
+        """
+        if not self.reachable(a) or not self.reachable(b):
+            return None
+        if self.dominates(a, b):
+            return a
+        if self.dominates(b, a):
+            return b
+        # Climb from `a` in steps of halving powers of two, as far as we
+        # can without reaching a dominator of `b`.
+        for jump in reversed(self._ancestors()):
+            up = jump[a]
+            if not self.dominates(up, b):
+                a = up
+        return self.idom[a]
+
+    def _ancestors(self):
+        # `jumps[k][node]` is the ancestor `2 ** k` levels above a node,
+        # or the entry if the tree is not that deep there. Built on first
+        # use, in O(n log n).
+        if self._jumps is None:
+            up = [node if parent is None else parent
+                  for node, parent in enumerate(self.idom)]
+            up[self.entry] = self.entry
+            self._jumps = [up]
+            height = max(self.depth) if self.preorder else 0
+            while (1 << len(self._jumps)) <= height:
+                up = [up[up[node]] for node in range(len(up))]
+                self._jumps.append(up)
+        return self._jumps
+
+    def children(self):
+        """Get the dominator tree, as a list of every node's children, in
+        reverse postorder. The lists are shared, so treat them as
+        read-only.
+        """
+        return self._children
+
+    def frontiers(self):
+        """Get the dominance frontier of every node, as a list of sets.
+        They are computed once and shared, so treat them as read-only.
+        """
+        if self._frontiers is not None:
+            return self._frontiers
+        self._frontiers = frontiers = [set() for _ in self.idom]
+        idom = self.idom
+        number = self.number
+        for node in self.rpo:
+            # The node is in the frontier of everything that dominates
+            # one of its predecessors without strictly dominating it:
+            # the predecessor and its ancestors in the tree, up to (not
+            # including) the node's immediate dominator. (Only join points
+            # and the entry have any.) Once a runner already has the node,
+            # an earlier predecessor's walk has added it all the way up.
+            for pred in self.preds[node]:
+                if number[pred] < 0:
+                    continue
+                runner = pred
+                while runner is not None and runner != idom[node]:
+                    frontier = frontiers[runner]
+                    if node in frontier:
+                        break
+                    frontier.add(node)
+                    runner = idom[runner]
+        return frontiers
+
+    def iterated_frontier(self, nodes):
+        """Get the iterated dominance frontier of some nodes: the limit of
+        taking the frontier of the nodes and everything added so far. For
+        a variable assigned in `nodes`, these are the nodes that need a
+        phi-node for it. The result lists them in the order they were
+        found. Unreachable nodes are ignored.
+        """
+        frontiers = self.frontiers()
+        number = self.number
+        work = [node for node in nodes if number[node] >= 0]
+        seen = set(work)
+        out = []
+        found = set()
+        for node in work:
+            for join in frontiers[node]:
+                if join not in found:
+                    found.add(join)
+                    out.append(join)
+                    if join not in seen:
+                        seen.add(join)
+                        work.append(join)
+        return out
+
+
+class DominatorSets(Mapping):
+    """A read-only map from node names to their sets of dominators,
+    computed from a `Dominance` when they are looked up.
+
+    `names[node]` is the name of each node ID. `container` builds each
+    set from the dominators' names, which come from the entry down.
+    """
+
+    def __init__(self, dominance, names, container=frozenset):
+        self.dominance = dominance
+        self.names = names
+        self.container = container
+        self.index = {name: node for node, name in enumerate(names)
+                      if name is not None}
+
+    def __getitem__(self, name):
+        names = self.names
+        return self.container(
+            names[n] for n in self.dominance.dominators(self.index[name])
+        )
+
+    def dominates(self, a, b):
+        """Check whether the node named `a` dominates the one named `b`,
+        without building any sets.
+        """
+        return self.dominance.dominates(self.index[a], self.index[b])
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
@@ -1,14 +1,15 @@
 import json
 import sys
 
-from cfg import block_map, add_terminators, add_entry, reassemble
-from form_blocks import form_blocks
+from cfg import CFG
+from util import set_instrs
 
 
 def func_from_ssa(func):
-    blocks = block_map(form_blocks(func['instrs']))
-    add_entry(blocks)
-    add_terminators(blocks)
+    cfg = CFG(func['instrs'])
+    cfg.add_entry()
+    cfg.add_terminators()
+    blocks = cfg.name_map()
 
     # Replace each phi-node.
     for block in blocks.values():
@@ -34,7 +35,7 @@ def func_from_ssa(func):
         new_block = [i for i in block if i.get('op') != 'phi']
         block[:] = new_block
 
-    func['instrs'] = reassemble(blocks)
+    set_instrs(func, cfg.reassemble())
 
 
 def from_ssa(bril):
@@ -0,0 +1,212 @@
+"""Generate synthetic Bril functions with a given control flow shape, for
+finding out how analyses and passes scale.
+
+    python3 gen_cfg.py loops 1000 | bril2txt
+    python3 gen_cfg.py switch 5000 --vars 100 | brili -p false
+
+Every shape builds `@main(c: bool)` out of blocks that each compute a few
+`add`s over `--vars` integer variables, repeated until the function has
+about SIZE instructions. All branches test the argument `c`, and running
+with `c` false takes the exit of every loop, so each function also
+terminates under `brili`:
+
+* `chain`: a straight line of blocks joined by jumps.
+* `loops`: loops nested `--depth` deep (by default, a single nest as deep
+  as the size allows).
+* `diamonds`: a chain of if-else diamonds.
+* `switch`: a cascade of `--fanout` branches (by default, one cascade as
+  wide as the size allows) whose cases all jump to a single join block.
+* `irreducible`: a chain of two-block loops that can be entered at
+  either block.
+* `random`: blocks that branch to random blocks anywhere in the function.
+"""
+
+import argparse
+import json
+import random
+
+
+class Builder:
+    """Accumulate a function's instructions, counting the ones that are
+    not labels.
+    """
+
+    def __init__(self, nvars, ops, seed):
+        self.rng = random.Random(seed)
+        self.names = ['v{}'.format(i) for i in range(nvars)]
+        self.ops = ops
+        self.instrs = []
+        self.size = 0
+        self.labels = 0
+        for i, name in enumerate(self.names):
+            self.emit({'op': 'const', 'dest': name, 'type': 'int',
+                       'value': i})
+
+    def emit(self, instr):
+        self.instrs.append(instr)
+        self.size += 1
+
+    def fresh(self, prefix):
+        """Get a new, unique label name.
+        """
+        self.labels += 1
+        return '{}{}'.format(prefix, self.labels)
+
+    def label(self, name):
+        self.instrs.append({'label': name})
+
+    def block(self, name):
+        """Start a block, and fill it with `ops` additions.
+        """
+        self.label(name)
+        choice = self.rng.choice
+        for _ in range(self.ops):
+            self.emit({'op': 'add', 'dest': choice(self.names),
+                       'type': 'int',
+                       'args': [choice(self.names), choice(self.names)]})
+
+    def jmp(self, target):
+        self.emit({'op': 'jmp', 'labels': [target]})
+
+    def br(self, true, false):
+        self.emit({'op': 'br', 'args': ['c'], 'labels': [true, false]})
+
+    def finish(self):
+        self.block(self.fresh('end'))
+        self.emit({'op': 'print', 'args': list(self.names)})
+        return {
+            'name': 'main',
+            'args': [{'name': 'c', 'type': 'bool'}],
+            'instrs': self.instrs,
+        }
+
+
+def gen_chain(b, size):
+    target = b.fresh('b')
+    while b.size < size:
+        b.block(target)
+        target = b.fresh('b')
+        b.jmp(target)
+    b.label(target)
+
+
+def gen_loops(b, size, depth=None):
+    # Each level of a nest takes three blocks and two control
+    # instructions.
+    per_level = 3 * b.ops + 2
+    if depth is None:
+        depth = max(1, -((b.size - size) // per_level))
+    while b.size < size:
+        nest = []
+        for _ in range(depth):
+            head, body, done = b.fresh('h'), b.fresh('b'), b.fresh('e')
+            nest.append((head, done))
+            b.block(head)
+            b.br(body, done)
+            b.block(body)
+        for head, done in reversed(nest):
+            b.jmp(head)
+            b.block(done)
+
+
+def gen_diamonds(b, size):
+    while b.size < size:
+        top, left, right, join = (b.fresh(p) for p in 'tlrj')
+        b.block(top)
+        b.br(left, right)
+        b.block(left)
+        b.jmp(join)
+        b.block(right)
+        b.jmp(join)
+        b.label(join)
+
+
+def gen_switch(b, size, fanout=None):
+    # Each case takes a test block and a case block, each ending in a
+    # control instruction.
+    per_case = 2 * b.ops + 2
+    if fanout is None:
+        fanout = max(1, -((b.size - size) // per_case))
+    while b.size < size:
+        join = b.fresh('j')
+        tests = [b.fresh('s') for _ in range(fanout)] + [join]
+        cases = [b.fresh('k') for _ in range(fanout)]
+        for i, case in enumerate(cases):
+            b.block(tests[i])
+            b.br(case, tests[i + 1])
+            b.block(case)
+            b.jmp(join)
+        b.label(join)
+
+
+def gen_irreducible(b, size):
+    while b.size < size:
+        entry, left, right, done = (b.fresh(p) for p in 'rxye')
+        b.block(entry)
+        b.br(left, right)
+        b.block(left)
+        b.br(right, done)
+        b.block(right)
+        b.br(left, done)
+        b.label(done)
+
+
+def gen_random(b, size):
+    # Decide on the number of blocks up front, so branches can go
+    # anywhere.
+    nblocks = max(1, (size - b.size) // (b.ops + 1))
+    names = ['b{}'.format(i) for i in range(nblocks)] + [b.fresh('end')]
+    for i in range(nblocks):
+        b.block(names[i])
+        if b.rng.random() < 0.5:
+            b.br(b.rng.choice(names), names[i + 1])
+        else:
+            b.jmp(names[i + 1])
+    b.label(names[-1])
+
+
+SHAPES = {
+    'chain': gen_chain,
+    'loops': gen_loops,
+    'diamonds': gen_diamonds,
+    'switch': gen_switch,
+    'irreducible': gen_irreducible,
+    'random': gen_random,
+}
+
+
+def gen_func(shape, size, nvars=16, ops=2, seed=0, **params):
+    """Generate a function of about `size` instructions with the given
+    shape. Extra keyword arguments (`depth` for `loops`, `fanout` for
+    `switch`) go to the shape.
+    """
+    b = Builder(nvars, ops, seed)
+    SHAPES[shape](b, size, **params)
+    return b.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('shape', choices=SHAPES)
+    parser.add_argument('size', type=int, help='number of instructions')
+    parser.add_argument('--vars', type=int, default=16,
+                        help='number of integer variables')
+    parser.add_argument('--ops', type=int, default=2,
+                        help='additions in each block')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--depth', type=int, help='loop nesting depth')
+    parser.add_argument('--fanout', type=int, help='cases in a switch')
+    args = parser.parse_args()
+
+    params = {}
+    if args.depth is not None:
+        params['depth'] = args.depth
+    if args.fanout is not None:
+        params['fanout'] = args.fanout
+    func = gen_func(args.shape, args.size, args.vars, args.ops, args.seed,
+                    **params)
+    print(json.dumps({'functions': [func]}, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,13 @@
 """Local value numbering for Bril.
 """
+import functools
 import json
 import sys
 from collections import namedtuple
 
 from form_blocks import form_blocks
-from util import flatten
+from parallel import jobs_flag, map_funcs
+from util import flatten, set_instrs
 
 # A Value uniquely represents a computation in terms of sub-values.
 Value = namedtuple('Value', ['op', 'args'])
@@ -246,23 +248,31 @@ def _canonicalize(value):
         return value
 
 
-def lvn(bril, prop=False, canon=False, fold=False):
+def lvn_func(func, prop=False, canon=False, fold=False):
     """Apply the local value numbering optimization to every basic block
-    in every function.
+    in a function.
     """
-    for func in bril['functions']:
-        blocks = list(form_blocks(func['instrs']))
-        for block in blocks:
-            lvn_block(
-                block,
-                lookup=_lookup if prop else lambda v2n, v: v2n.get(v),
-                canonicalize=_canonicalize if canon else lambda v: v,
-                fold=_fold if fold else lambda n2c, v: None,
-            )
-        func['instrs'] = flatten(blocks)
+    blocks = list(form_blocks(func['instrs']))
+    for block in blocks:
+        lvn_block(
+            block,
+            lookup=_lookup if prop else lambda v2n, v: v2n.get(v),
+            canonicalize=_canonicalize if canon else lambda v: v,
+            fold=_fold if fold else lambda n2c, v: None,
+        )
+    set_instrs(func, flatten(blocks))
+
+
+def lvn(bril, prop=False, canon=False, fold=False, jobs=1):
+    """Apply the local value numbering optimization to every function,
+    with `jobs` worker processes (see `parallel.map_funcs`).
+    """
+    map_funcs(functools.partial(lvn_func, prop=prop, canon=canon, fold=fold),
+              bril['functions'], jobs)
 
 
 if __name__ == '__main__':
     bril = json.load(sys.stdin)
-    lvn(bril, '-p' in sys.argv, '-c' in sys.argv, '-f' in sys.argv)
+    lvn(bril, '-p' in sys.argv, '-c' in sys.argv, '-f' in sys.argv,
+        jobs_flag(sys.argv[1:]))
     json.dump(bril, sys.stdout, indent=2, sort_keys=True)
@@ -0,0 +1,85 @@
+"""Run a per-function pass over a whole program in a pool of worker
+processes.
+
+Most passes handle every function independently. `map_funcs` ships the
+functions to a `ProcessPoolExecutor` in batches of roughly equal size,
+and the results come back in the functions' original order. Pickling a
+function costs about as much as a cheap pass over it, so programs with
+fewer than `MIN_INSTRS` instructions are processed serially instead.
+
+The function to apply has to be picklable: a module-level function, or
+a `functools.partial` of one.
+"""
+
+import concurrent.futures
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'bril-txt'))
+
+MIN_INSTRS = 1 << 14
+
+
+def _size(func):
+    return len(func.get('instrs', ())) + 1
+
+
+def batches(funcs, count):
+    """Split a list of functions into at most `count` runs of
+    consecutive functions with about the same number of instructions.
+    """
+    target = sum(_size(func) for func in funcs) / count
+    out = [[]]
+    size = 0
+    for func in funcs:
+        if size >= target and len(out) < count:
+            out.append([])
+            size = 0
+        out[-1].append(func)
+        size += _size(func)
+    return out
+
+
+def _run_batch(fn, inplace, funcs):
+    if inplace:
+        return [(fn(func), func) for func in funcs]
+    else:
+        return [(fn(func), None) for func in funcs]
+
+
+def map_funcs(fn, funcs, jobs=None, min_instrs=MIN_INSTRS, inplace=True):
+    """Call `fn(func)` on every function in the list `funcs` and return
+    the results in order, using `jobs` worker processes (by default, one
+    per CPU).
+
+    `fn` may modify its function in place. When the functions are sent
+    to workers, the modified copies replace the originals in `funcs`.
+    Pass `inplace=False` if `fn` leaves its function alone, so they are
+    not sent back.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if (jobs <= 1 or len(funcs) < 2
+            or sum(_size(func) for func in funcs) < min_instrs):
+        return [fn(func) for func in funcs]
+
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        futures = [pool.submit(_run_batch, fn, inplace, batch)
+                   for batch in batches(funcs, 4 * jobs)]
+        for future in futures:
+            for result, func in future.result():
+                if inplace:
+                    funcs[len(results)] = func
+                results.append(result)
+    return results
+
+
+def jobs_flag(args):
+    """Get the number of worker processes from a `-j [N]` flag, the same
+    way bril2json does (see `briltxt.jobs_flag`).
+    """
+    if '-j' not in args:
+        return 1  # Don't load the parser just to find that out.
+    import briltxt
+    return briltxt.jobs_flag(args)
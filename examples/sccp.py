@@ -0,0 +1,282 @@
+"""Sparse conditional constant propagation for Bril programs in SSA form
+(such as the output of `to_ssa.py`).
+
+The analysis (Wegman and Zadeck's) tracks which CFG edges can execute
+and which constant each SSA variable holds, and it only follows def-use
+edges: when a variable's value changes, only its uses are reevaluated.
+Phis are updated one operand at a time, as edges become executable and
+as their arguments change.
+Then the pass replaces constant computations with `const`, turns
+branches on constants into jumps, and deletes the blocks that can never
+execute.
+"""
+
+import json
+import sys
+
+from cfg import CFG
+from util import set_instrs
+
+# The lattice: a variable is TOP (no value seen yet), a constant, or
+# BOTTOM (not a constant). Constants are Python ints and bools.
+TOP = object()
+BOTTOM = object()
+
+INT_BITS = 64
+
+
+def _wrap(n):
+    """Wrap an integer to a 64-bit two's complement value, like Bril's
+    arithmetic.
+    """
+    half = 1 << (INT_BITS - 1)
+    return (n + half) % (1 << INT_BITS) - half
+
+
+def _div(a, b):
+    """Integer division that truncates toward zero.
+    """
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+FOLDABLE_OPS = {
+    'add': lambda a, b: _wrap(a + b),
+    'mul': lambda a, b: _wrap(a * b),
+    'sub': lambda a, b: _wrap(a - b),
+    'div': lambda a, b: _wrap(_div(a, b)),
+    'eq': lambda a, b: a == b,
+    'lt': lambda a, b: a < b,
+    'gt': lambda a, b: a > b,
+    'le': lambda a, b: a <= b,
+    'ge': lambda a, b: a >= b,
+    'not': lambda a: not a,
+    'and': lambda a, b: a and b,
+    'or': lambda a, b: a or b,
+}
+
+# The constant that decides `and` and `or` on its own.
+ABSORBING = {'and': False, 'or': True}
+
+
+def meet(a, b):
+    if a is TOP:
+        return b
+    if b is TOP:
+        return a
+    if a is BOTTOM or b is BOTTOM or a != b:
+        return BOTTOM
+    return a
+
+
+def evaluate(instr, args):
+    """Compute the lattice value of an instruction's result from the
+    values of its arguments.
+    """
+    op = instr['op']
+    if op == 'const':
+        if instr['type'] in ('int', 'bool'):
+            return instr['value']
+        return BOTTOM
+    if op == 'id':
+        return args[0]
+    if op not in FOLDABLE_OPS:
+        return BOTTOM
+
+    if op in ABSORBING and ABSORBING[op] in args:
+        return ABSORBING[op]
+    if BOTTOM in args:
+        return BOTTOM
+    if TOP in args:
+        return TOP
+    if op == 'div' and args[1] == 0:
+        return BOTTOM  # A run-time error; leave it alone.
+    return FOLDABLE_OPS[op](*args)
+
+
+def sccp_analyze(cfg, func):
+    """Find the values of the variables and the executable edges in a
+    function. Return a map from variables to lattice values and the set
+    of executable `(source, destination)` edges, by block ID.
+    """
+    values = {arg['name']: BOTTOM for arg in func.get('args', [])}
+
+    # Def-use edges: the instructions that use each variable, as
+    # `(block ID, instruction, slot)`. For a phi, the slot is the
+    # `(predecessor ID, argument)` of the operand; otherwise, it is None.
+    # `phi_slots[block][pred]` lists the `(phi, argument)` operands that
+    # an edge from `pred` supplies.
+    uses = {}
+    phi_slots = {}
+    for block in cfg:
+        for instr in block.instrs:
+            if instr.get('op') == 'phi':
+                slots = phi_slots.setdefault(block.id, {})
+                for arg, label in zip(instr['args'], instr['labels']):
+                    if label in cfg.index:
+                        pred = cfg.index[label]
+                        slots.setdefault(pred, []).append((instr, arg))
+                        uses.setdefault(arg, []).append(
+                            (block.id, instr, (pred, arg)))
+                continue
+            for arg in instr.get('args', ()):
+                uses.setdefault(arg, []).append((block.id, instr, None))
+
+    visited = set()
+    executable = set()
+    flow_worklist = [(None, cfg.entry)]
+    ssa_worklist = []
+
+    def value(var):
+        return values.get(var, TOP)
+
+    def mark(src, dest):
+        if (src, dest) not in executable:
+            flow_worklist.append((src, dest))
+
+    def update(dest, new):
+        if new is not value(dest) and new != value(dest):
+            values[dest] = new
+            ssa_worklist.extend(uses.get(dest, ()))
+
+    def meet_operand(instr, arg):
+        # Values only go down, so meeting one operand into the phi's
+        # current value is the same as meeting all of them again.
+        update(instr['dest'], meet(value(instr['dest']), value(arg)))
+
+    def visit(block_id, instr):
+        op = instr.get('op')
+        if op == 'phi':
+            return  # Updated operand by operand.
+        elif 'dest' in instr:
+            new = evaluate(instr, [value(arg)
+                                   for arg in instr.get('args', ())])
+        else:
+            if op == 'br':
+                cond = value(instr['args'][0])
+                if cond is BOTTOM:
+                    targets = instr['labels']
+                elif cond is TOP:
+                    targets = []
+                else:
+                    targets = [instr['labels'][0 if cond else 1]]
+            elif op == 'jmp':
+                targets = instr['labels']
+            else:
+                targets = []
+            for label in targets:
+                mark(block_id, cfg.index[label])
+            return
+
+        update(instr['dest'], new)
+
+    def run():
+        while flow_worklist or ssa_worklist:
+            while flow_worklist:
+                edge = flow_worklist.pop()
+                if edge in executable:
+                    continue
+                executable.add(edge)
+                src, block_id = edge
+                # Only the phi operands from the new edge can change.
+                for instr, arg in phi_slots.get(block_id, {}).get(src, ()):
+                    meet_operand(instr, arg)
+                if block_id not in visited:
+                    visited.add(block_id)
+                    for instr in cfg.blocks[block_id].instrs:
+                        visit(block_id, instr)
+
+            while ssa_worklist:
+                block_id, instr, slot = ssa_worklist.pop()
+                if slot is not None:
+                    if (slot[0], block_id) in executable:
+                        meet_operand(instr, slot[1])
+                elif block_id in visited:
+                    visit(block_id, instr)
+
+    run()
+
+    # A branch whose condition never gets a value depends on undefined
+    # variables. Give up on such conditions (and keep both successors)
+    # rather than deleting blocks the branch still refers to. Values only
+    # go down, so a branch that has been decided stays decided.
+    branches = [(block.id, block.instrs[-1]) for block in cfg
+                if block.instrs[-1]['op'] == 'br']
+    while True:
+        branches = [(block_id, instr) for block_id, instr in branches
+                    if value(instr['args'][0]) is TOP]
+        undecided = [instr for block_id, instr in branches
+                     if block_id in visited]
+        if not undecided:
+            break
+        for instr in undecided:
+            cond = instr['args'][0]
+            values[cond] = BOTTOM
+            ssa_worklist.extend(uses.get(cond, ()))
+        run()
+
+    executable.discard((None, cfg.entry))
+    return values, visited, executable
+
+
+def func_sccp(func):
+    cfg = CFG(func['instrs'])
+    cfg.add_entry()
+    cfg.add_terminators()
+    values, reachable, executable = sccp_analyze(cfg, func)
+
+    for block in cfg:
+        if block.id not in reachable:
+            continue
+        for instr in block.instrs:
+            # Replace computations of constants.
+            if 'dest' in instr and instr['op'] != 'const':
+                val = values.get(instr['dest'], TOP)
+                if val is not TOP and val is not BOTTOM:
+                    for key in ('args', 'labels', 'funcs'):
+                        instr.pop(key, None)
+                    instr['op'] = 'const'
+                    instr['value'] = val
+                    continue
+
+            # Drop phi arguments from edges that never execute, and from
+            # labels that name no block.
+            if instr['op'] == 'phi':
+                pairs = [(arg, label) for arg, label
+                         in zip(instr['args'], instr['labels'])
+                         if label in cfg.index
+                         and (cfg.index[label], block.id) in executable]
+                instr['args'] = [arg for arg, _ in pairs]
+                instr['labels'] = [label for _, label in pairs]
+
+        # Turn constant branches into jumps.
+        term = block.instrs[-1]
+        if term['op'] == 'br':
+            cond = values.get(term['args'][0], TOP)
+            if cond is not BOTTOM:
+                taken, not_taken = term['labels'][::1 if cond else -1]
+                del term['args']
+                term['op'] = 'jmp'
+                term['labels'] = [taken]
+                if taken != not_taken:
+                    cfg.remove_edge(block.id, cfg.index[not_taken])
+
+    # Delete the blocks that never execute.
+    dead = [block.id for block in cfg if block.id not in reachable]
+    for block_id in dead:
+        for succ in list(cfg.succs[block_id]):
+            cfg.remove_edge(block_id, succ)
+    for block_id in dead:
+        cfg.remove_block(block_id)
+
+    set_instrs(func, cfg.reassemble())
+
+
+def sccp(bril):
+    for func in bril['functions']:
+        func_sccp(func)
+    return bril
+
+
+if __name__ == '__main__':
+    print(json.dumps(sccp(json.load(sys.stdin)), indent=2, sort_keys=True))
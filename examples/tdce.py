@@ -5,7 +5,8 @@ local optimization.
 import sys
 import json
 from form_blocks import form_blocks
-from util import flatten
+from parallel import jobs_flag, map_funcs
+from util import flatten, set_instrs
 
 
 def trivial_dce_pass(func):
@@ -40,7 +41,7 @@ def trivial_dce_pass(func):
         block[:] = new_block
 
     # Reassemble the function.
-    func['instrs'] = flatten(blocks)
+    set_instrs(func, flatten(blocks))
 
     return changed
 
@@ -101,7 +102,7 @@ def drop_killed_pass(func):
     changed = False
     for block in blocks:
         changed |= drop_killed_local(block)
-    func['instrs'] = flatten(blocks)
+    set_instrs(func, flatten(blocks))
     return changed
 
 
@@ -121,15 +122,15 @@ MODES = {
 
 
 def localopt():
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 1 and sys.argv[1] in MODES:
         modify_func = MODES[sys.argv[1]]
     else:
         modify_func = trivial_dce
 
-    # Apply the change to all the functions in the input program.
+    # Apply the change to all the functions in the input program (in
+    # parallel, with `-j`).
     bril = json.load(sys.stdin)
-    for func in bril['functions']:
-        modify_func(func)
+    map_funcs(modify_func, bril['functions'], jobs_flag(sys.argv[1:]))
     json.dump(bril, sys.stdout, indent=2, sort_keys=True)
 
 
@@ -1,10 +1,12 @@
+import functools
 import json
 import sys
 from collections import defaultdict
 
-from cfg import block_map, successors, add_terminators, add_entry, reassemble
-from form_blocks import form_blocks
-from dom import get_dom, dom_fronts, dom_tree
+from analysis import AnalysisManager
+from parallel import jobs_flag, map_funcs
+import traverse
+from util import set_instrs
 
 
 def def_blocks(blocks):
@@ -18,24 +20,40 @@ def def_blocks(blocks):
     return dict(out)
 
 
-def get_phis(blocks, df, defs):
-    """Find where to insert phi-nodes in the blocks.
+def nonlocal_vars(blocks):
+    """Get the variables that some block reads before it assigns them.
+    The others never hold a value from one block to the next.
+    """
+    out = set()
+    for block in blocks.values():
+        assigned = set()
+        for instr in block:
+            out.update(a for a in instr.get('args', ()) if a not in assigned)
+            if 'dest' in instr:
+                assigned.add(instr['dest'])
+    return out
+
+
+def get_phis(blocks, dom, defs, live_in=None):
+    """Find where to insert phi-nodes in the blocks, given the dominance
+    relation from `dom.get_dom`. If `live_in` maps block names to the
+    variables live at their start, leave out the phi-nodes for variables
+    that are dead.
 
     Produce a map from block names to variable names that need phi-nodes
     in those blocks. (We will need to generate names and actually insert
     instructions later.)
     """
     phis = {b: set() for b in blocks}
+    names = dom.names
     for v, v_defs in defs.items():
-        v_defs_list = list(v_defs)
-        for d in v_defs_list:
-            for block in df[d]:
-                # Add a phi-node...
-                if v not in phis[block]:
-                    # ..unless we already did.
-                    phis[block].add(v)
-                    if block not in v_defs_list:
-                        v_defs_list.append(block)
+        # A variable needs phi-nodes in the iterated dominance frontier of
+        # the blocks that define it.
+        sites = dom.dominance.iterated_frontier(dom.index[d] for d in v_defs)
+        for node in sites:
+            name = names[node]
+            if live_in is None or v in live_in[name]:
+                phis[name].add(v)
     return phis
 
 
@@ -51,9 +69,13 @@ def ssa_rename(blocks, phis, succ, domtree, args):
         stack[var].insert(0, fresh)
         return fresh
 
+    # The stacks as they were before each block on the current path down
+    # the dominator tree.
+    saved = []
+
     def _rename(block):
         # Save stacks.
-        old_stack = {k: list(v) for k, v in stack.items()}
+        saved.append({k: list(v) for k, v in stack.items()})
 
         # Rename phi-node destinations.
         for p in phis[block]:
@@ -78,16 +100,16 @@ def ssa_rename(blocks, phis, succ, domtree, args):
                     # The variable is not defined on this path
                     phi_args[s][p].append((block, "__undefined"))
 
-        # Recursive calls.
-        for b in sorted(domtree[block]):
-            _rename(b)
-
+    def _restore(block):
         # Restore stacks.
         stack.clear()
-        stack.update(old_stack)
+        stack.update(saved.pop())
 
+    # Rename down the dominator tree (without recursion, which deep CFGs
+    # would run out of).
     entry = list(blocks.keys())[0]
-    _rename(entry)
+    traverse.walk_tree(entry, lambda b: sorted(domtree[b]), _rename,
+                       _restore)
 
     return phi_args, phi_dests
 
@@ -116,31 +138,65 @@ def get_types(func):
     return types
 
 
-def func_to_ssa(func):
-    blocks = block_map(form_blocks(func['instrs']))
-    add_entry(blocks)
-    add_terminators(blocks)
-    succ = {name: successors(block[-1]) for name, block in blocks.items()}
-    dom = get_dom(succ, list(blocks.keys())[0])
+# Which phi-nodes to insert: all of them (`minimal`), only those for
+# variables that live from one block to another (`semi-pruned`), or only
+# those for variables that are live where the phi-node would go
+# (`pruned`, which has to solve liveness first).
+MODES = ('minimal', 'semi-pruned', 'pruned')
+
 
-    df = dom_fronts(dom, succ)
+def func_to_ssa(func, am=None, mode='minimal'):
+    """Convert a function to SSA form, taking its CFG and dominance
+    information from an `AnalysisManager` if one is given. `mode` is one
+    of `MODES`. The number of phi-nodes inserted is added to the
+    manager's `stats`, as `('ssa', 'phis')`.
+    """
+    am = am or AnalysisManager()
+    cfg = am.get(func, 'cfg')
+    blocks = cfg.name_map()
+    succ = am.get(func, 'succ')
+    dom = am.get(func, 'dom')
     defs = def_blocks(blocks)
     types = get_types(func)
     arg_names = {a['name'] for a in func['args']} if 'args' in func else set()
 
-    phis = get_phis(blocks, df, defs)
-    phi_args, phi_dests = ssa_rename(blocks, phis, succ, dom_tree(dom),
-                                     arg_names)
+    live_in = None
+    if mode == 'semi-pruned':
+        needed = nonlocal_vars(blocks)
+        defs = {v: d for v, d in defs.items() if v in needed}
+    elif mode == 'pruned':
+        live_in = am.get(func, 'live').in_
+    phis = get_phis(blocks, dom, defs, live_in)
+    am.stats['ssa', 'phis'] += sum(len(p) for p in phis.values())
+    phi_args, phi_dests = ssa_rename(blocks, phis, succ,
+                                     am.get(func, 'dom_tree'), arg_names)
     insert_phis(blocks, phi_args, phi_dests, types)
 
-    func['instrs'] = reassemble(blocks)
+    set_instrs(func, cfg.reassemble())
 
 
-def to_ssa(bril):
-    for func in bril['functions']:
-        func_to_ssa(func)
+def to_ssa(bril, am=None, jobs=1, mode='minimal'):
+    """Convert every function to SSA form. Without an `AnalysisManager`,
+    the functions can be converted by `jobs` worker processes (see
+    `parallel.map_funcs`).
+    """
+    if mode not in MODES:
+        raise ValueError('unknown SSA mode: {}'.format(mode))
+    if am is None:
+        map_funcs(functools.partial(func_to_ssa, mode=mode),
+                  bril['functions'], jobs)
+    else:
+        for func in bril['functions']:
+            func_to_ssa(func, am, mode)
     return bril
 
 
 if __name__ == '__main__':
-    print(json.dumps(to_ssa(json.load(sys.stdin)), indent=2, sort_keys=True))
+    mode = 'minimal'
+    if '--pruned' in sys.argv:
+        mode = 'pruned'
+    elif '--semi-pruned' in sys.argv:
+        mode = 'semi-pruned'
+    bril = to_ssa(json.load(sys.stdin), jobs=jobs_flag(sys.argv[1:]),
+                  mode=mode)
+    print(json.dumps(bril, indent=2, sort_keys=True))
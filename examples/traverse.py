@@ -0,0 +1,93 @@
+"""Depth-first traversals of graphs and trees, without recursion.
+
+Generated CFGs (and their dominator trees) can be tens of thousands of
+blocks deep, far past Python's recursion limit, so every traversal here
+keeps its own stack. Nodes are visited in the same order a recursive
+traversal would visit them.
+
+Graph nodes are integer IDs and edges are adjacency lists indexed by ID,
+like in `cfg.CFG`.
+"""
+
+
+def dfs(succs, roots, pre=None, post=None, seen=None):
+    """Walk the nodes reachable from `roots` depth-first, following the
+    edges in order. Call `pre(node)` when a node is first reached and
+    `post(node)` when everything below it is done.
+
+    Nodes in `seen` (a set, which is updated) are not visited again, so
+    passing the same set to several calls continues one traversal.
+    """
+    if seen is None:
+        seen = set()
+    for root in roots:
+        if root in seen:
+            continue
+        seen.add(root)
+        if pre:
+            pre(root)
+        stack = [(root, iter(succs[root]))]
+        while stack:
+            node, it = stack[-1]
+            for succ in it:
+                if succ not in seen:
+                    seen.add(succ)
+                    if pre:
+                        pre(succ)
+                    stack.append((succ, iter(succs[succ])))
+                    break
+            else:
+                stack.pop()
+                if post:
+                    post(node)
+
+
+def postorder(succs, roots):
+    """Get the nodes reachable from `roots` in postorder.
+    """
+    out = []
+    seen = set()
+    for root in roots:
+        if root in seen:
+            continue
+        seen.add(root)
+        stack = [(root, iter(succs[root]))]
+        while stack:
+            node, it = stack[-1]
+            for succ in it:
+                if succ not in seen:
+                    seen.add(succ)
+                    stack.append((succ, iter(succs[succ])))
+                    break
+            else:
+                stack.pop()
+                out.append(node)
+    return out
+
+
+def reverse_postorder(succs, roots):
+    """Get the nodes reachable from `roots` in reverse postorder.
+    """
+    order = postorder(succs, roots)
+    order.reverse()
+    return order
+
+
+def walk_tree(root, children, enter, leave=None):
+    """Walk a tree depth-first from `root`, where `children(node)` gives
+    a node's children. Call `enter(node)` before visiting the children
+    and `leave(node)` after, as a recursive walk would (such as renaming
+    variables down a dominator tree, and undoing it on the way back).
+    """
+    enter(root)
+    stack = [(root, iter(children(root)))]
+    while stack:
+        node, it = stack[-1]
+        for child in it:
+            enter(child)
+            stack.append((child, iter(children(child))))
+            break
+        else:
+            stack.pop()
+            if leave:
+                leave(node)
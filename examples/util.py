@@ -16,3 +16,24 @@ def fresh(seed, names):
         if name not in names:
             return name
         i += 1
+
+
+def set_instrs(func, instrs):
+    """Replace the instructions in a function.
+
+    If the function has a source position table (see `briltxt.instr_pos`),
+    rebuild it for the new instructions: instructions that were already
+    in the function keep their positions, and new ones get none (0).
+    """
+    table = func.get('positions')
+    if table is not None:
+        old = {id(instr): (row, col) for instr, row, col
+               in zip(func['instrs'], table['row'], table['col'])}
+        rows = []
+        cols = []
+        for instr in instrs:
+            row, col = old.get(id(instr), (0, 0))
+            rows.append(row)
+            cols.append(col)
+        func['positions'] = {'row': rows, 'col': cols}
+    func['instrs'] = instrs
@@ -0,0 +1,66 @@
+"""A priority worklist for iterating data flow analyses to a fixed point.
+
+Nodes are integer IDs (such as `cfg.CFG` block IDs) and edges are
+adjacency lists indexed by ID. The worklist always hands out the queued
+node that comes first in a given order, so a forward analysis that
+visits blocks in reverse postorder (and a backward one that visits them
+in postorder) sees most of a block's inputs settle before the block
+itself is processed. A node is never queued twice.
+"""
+
+import heapq
+
+
+def cfg_order(cfg, forward=True):
+    """Get the order to visit the blocks of a `cfg.CFG` in: reverse
+    postorder for forward analyses and postorder for backward ones.
+    Unreachable blocks are visited too, after (or, backward, before) the
+    reachable ones.
+    """
+    order = list(cfg.rpo())
+    reached = set(order)
+    order += [n for n in cfg.order if n not in reached]
+    if not forward:
+        order.reverse()
+    return order
+
+
+def iterate(order, out_edges, visit, stats=None):
+    """Visit nodes until nothing changes.
+
+    Every node in `order` is visited at least once. `visit(node)` updates
+    the node's value and returns whether it changed, in which case the
+    nodes along `out_edges[node]` are queued again (if they are in
+    `order`; others are left alone). Among the queued nodes, the first
+    in `order` is visited next.
+
+    If `stats` is a `Counter`, add the number of `transfers` (calls to
+    `visit`) and `iterations` (sweeps through the order, which start
+    whenever the worklist has to go back to an earlier node) to it.
+    """
+    # Nodes are queued by their position in the order.
+    rank = {node: i for i, node in enumerate(order)}
+    queued = bytearray(b'\x01') * len(order)
+    heap = list(range(len(order)))  # Already a heap.
+
+    transfers = iterations = 0
+    last = len(order)
+    while heap:
+        i = heapq.heappop(heap)
+        node = order[i]
+        queued[i] = 0
+        transfers += 1
+        if i <= last:
+            iterations += 1
+        last = i
+
+        if visit(node):
+            for succ in out_edges[node]:
+                j = rank.get(succ)
+                if j is not None and not queued[j]:
+                    queued[j] = 1
+                    heapq.heappush(heap, j)
+
+    if stats is not None:
+        stats['transfers'] += transfers
+        stats['iterations'] += iterations
@@ -0,0 +1,231 @@
+"""Measure how the analyses and passes in this repository scale with the
+size of the function they work on.
+
+    python3 scaling.py
+    python3 scaling.py --shapes loops,switch --stages ssa,dom --max 100000
+
+Each stage runs on synthetic functions from `examples/gen_cfg.py`, of
+every shape and of sizes from `--min` to `--max` instructions (two sizes
+per power of ten). The driver fits the growth rate of each stage: the
+exponent `k` in `time ~ size^k`, from a least-squares fit on a log-log
+scale. Stages with `k` above `--threshold` are flagged as super-linear.
+
+A stage stops growing once its next run would take longer than
+`--budget` seconds (extrapolating from the runs so far), or after it
+fails. Failures (such as `RecursionError` on deep CFGs) are reported,
+and count as flagged too.
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import math
+import os
+import sys
+import time
+
+import bril_opt
+
+sys.path.append(os.path.join(bril_opt.BASE, 'bril-llvm'))
+
+import gen_cfg  # noqa: E402
+
+# Runs shorter than this are too noisy to fit.
+MIN_TIME = 1e-3
+
+
+def pipeline_stage(spec):
+    """Make a stage from a `bril_opt` pipeline.
+    """
+    pipeline = bril_opt.parse_pipeline(spec)
+
+    def run(bril):
+        bril_opt.run_pipeline(bril, pipeline)
+    return run
+
+
+def data_flow_stage(analysis):
+    def run(bril):
+        bril_opt.load('data_flow.py').main(bril, analysis)
+    return run
+
+
+def dominators_stage(bril):
+    bril_opt.load('dominators.py').main(bril)
+
+
+def llvm_dom_stage(bril):
+    dom = bril_opt.load('bril-llvm/dom.py')
+    for func in bril['functions']:
+        dom.Dominators(func)
+
+
+# Stages, with the pipeline (if any) that prepares their input.
+STAGES = {
+    'df:defined': (None, pipeline_stage('df:defined')),
+    'df:live': (None, pipeline_stage('df:live')),
+    'df:cprop': (None, pipeline_stage('df:cprop')),
+    'dom': (None, pipeline_stage('dom:dom')),
+    'dom:front': (None, pipeline_stage('dom:front')),
+    'dom:tree': (None, pipeline_stage('dom:tree')),
+    'data_flow:reaching': (None, data_flow_stage('reaching')),
+    'data_flow:live': (None, data_flow_stage('live')),
+    'dominators': (None, dominators_stage),
+    'llvm-dom': (None, llvm_dom_stage),
+    'tdce+': (None, pipeline_stage('tdce+')),
+    'lvn': (None, pipeline_stage('lvn:pcf')),
+    'dce': (None, pipeline_stage('dce')),
+    'ssa': (None, pipeline_stage('ssa')),
+    'from_ssa': ('ssa', pipeline_stage('from_ssa')),
+    'sccp': ('ssa', pipeline_stage('sccp')),
+    'top-tdce': (None, pipeline_stage('top-tdce')),
+    'top-lvn': (None, pipeline_stage('top-lvn')),
+    'top-ssa': (None, pipeline_stage('top-ssa')),
+}
+
+
+def sizes(lo, hi, steps=2):
+    """Get `steps` sizes per power of ten from `lo` up to `hi`.
+    """
+    out = []
+    i = 0
+    while True:
+        size = round(lo * 10 ** (i / steps))
+        if size > hi:
+            return out
+        out.append(size)
+        i += 1
+
+
+def time_stage(run, text, repeat_below=0.1):
+    """Time a stage on a fresh copy of the program in `text` (as JSON).
+    Quick stages run a few times, and the best time counts.
+
+    Like `timeit`, this turns off the garbage collector while the stage
+    runs. Otherwise its full collections, which scan every object, make
+    all stages look super-linear on big programs.
+    """
+    best = math.inf
+    total = 0.0
+    for _ in range(5):
+        bril = json.loads(text)
+        with open(os.devnull, 'w') as null, \
+                contextlib.redirect_stdout(null), \
+                contextlib.redirect_stderr(null):
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                run(bril)
+                elapsed = time.perf_counter() - start
+            finally:
+                gc.enable()
+        best = min(best, elapsed)
+        total += elapsed
+        if total >= repeat_below:
+            break
+    return best
+
+
+def fit_exponent(points):
+    """Fit `time ~ size^k` to `(size, time)` pairs and return `k`, or
+    None if there are not enough measurable points.
+    """
+    points = [(math.log(n), math.log(t)) for n, t in points
+              if t >= MIN_TIME]
+    if len(points) < 2:
+        return None
+    mx = sum(x for x, _ in points) / len(points)
+    my = sum(y for _, y in points) / len(points)
+    sxx = sum((x - mx) ** 2 for x, _ in points)
+    sxy = sum((x - mx) * (y - my) for x, y in points)
+    return sxy / sxx if sxx else None
+
+
+def measure(stage, shape, size_list, budget, nvars):
+    """Time a stage on functions of one shape and growing sizes. Return
+    the `(size, time)` points and the error that stopped it, if any.
+    """
+    setup, run = STAGES[stage]
+    points = []
+    for size in size_list:
+        if points:
+            # Extrapolate, assuming at least linear growth.
+            k = max(fit_exponent(points) or 1.0, 1.0)
+            last_n, last_t = points[-1]
+            if last_t * (size / last_n) ** k > budget:
+                break
+
+        bril = {'functions': [gen_cfg.gen_func(shape, size, nvars)]}
+        try:
+            if setup:
+                with contextlib.redirect_stdout(sys.stderr):
+                    bril = bril_opt.run_pipeline(
+                        bril, bril_opt.parse_pipeline(setup))
+        except Exception as exc:
+            return points, '{} at {} (in {})'.format(
+                type(exc).__name__, size, setup)
+        try:
+            elapsed = time_stage(run, json.dumps(bril))
+        except Exception as exc:
+            return points, '{} at {}'.format(type(exc).__name__, size)
+        points.append((size, elapsed))
+    return points, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--shapes', default=','.join(gen_cfg.SHAPES),
+                        help='comma-separated CFG shapes')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help='comma-separated stages')
+    parser.add_argument('--min', type=int, default=100,
+                        help='smallest function, in instructions')
+    parser.add_argument('--max', type=int, default=1000000,
+                        help='largest function, in instructions')
+    parser.add_argument('--budget', type=float, default=5.0,
+                        help='longest run to attempt, in seconds')
+    parser.add_argument('--threshold', type=float, default=1.3,
+                        help='exponent above which to flag a stage')
+    parser.add_argument('--vars', type=int, default=16,
+                        help='variables in each function')
+    args = parser.parse_args()
+
+    shapes = args.shapes.split(',')
+    stages = args.stages.split(',')
+    for name in stages:
+        if name not in STAGES:
+            parser.error('unknown stage: {}'.format(name))
+    for name in shapes:
+        if name not in gen_cfg.SHAPES:
+            parser.error('unknown shape: {}'.format(name))
+
+    size_list = sizes(args.min, args.max)
+    flagged = []
+    for shape in shapes:
+        print('{} ({})'.format(shape, ', '.join(map(str, size_list))))
+        for stage in stages:
+            points, error = measure(stage, shape, size_list, args.budget,
+                                    args.vars)
+            k = fit_exponent(points)
+            times = ' '.join('{:.3g}'.format(t) for _, t in points)
+            note = ''
+            if error:
+                note = error
+            elif k is not None and k > args.threshold:
+                note = 'super-linear'
+            if note:
+                flagged.append((stage, shape, note))
+            print('  {:<20} k={:<5} {}  {}'.format(
+                stage, '?' if k is None else '{:.2f}'.format(k), times,
+                note,
+            ).rstrip(), flush=True)
+
+    if flagged:
+        print('flagged:')
+        for stage, shape, note in flagged:
+            print('  {:<20} {:<12} {}'.format(stage, shape, note))
+
+
+if __name__ == '__main__':
+    main()
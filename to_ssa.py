@@ -1,7 +1,10 @@
 import sys
 import json
-from typing import Tuple, List, Dict, Set
-from dominators import program_to_basic_blocks, BasicBlock, get_dominance_frontier, get_dominance_tree, get_dominators
+from typing import Tuple, List, Dict, Optional, Set
+from dominators import cfg_to_basic_blocks, BasicBlock, get_dominance_tree, get_dominators
+from cfg import CFG
+from traverse import walk_tree
+from data_flow import live_variables
 
 
 def get_globals(blocks: Dict[str, BasicBlock]) -> Tuple[set, dict]:
@@ -26,121 +29,200 @@ def get_globals(blocks: Dict[str, BasicBlock]) -> Tuple[set, dict]:
     return globals, defs
 
 
-def insert_phi_functions(globals, definitions, dominance_frontier, blocks: Dict[str, BasicBlock]) -> None:
-    for var in globals:
-        work_list = list(definitions[var])
-        for block in work_list:
-            for frontier_block_label in dominance_frontier[block]:
-                frontier_block = blocks[frontier_block_label]
-                phi_instr_found = False
-                for instr in frontier_block.instrs:
-                    if 'op' in instr and instr['op'] == 'phi' and instr['dest'] == var:
-                        phi_instr_found = True
-                        break
-
-                if not phi_instr_found:
-                    phi_instr = {
-                        'op': 'phi',
-                        'dest': var,
-                        'type': 'int',
-                        'labels': [block],
-                        'args': [var]
-                    }
-                    frontier_block.instrs.insert(0, phi_instr)
-                    work_list.append(frontier_block.label)
-                else:
-                    phi_instr = instr
-                    phi_instr['labels'].append(block)
-                    phi_instr['args'].append(var)
-
-
-
-def rename_ssa(blocks: Dict[str, BasicBlock], globals_: Set[str], dom_tree: Dict[str, List[str]]):
-    counter = {}
-    stack = {}
-
-    def newname(n):
-        i = counter[n]
-        counter[n] += 1
-        stack[n].insert(0, i)
-        return f'{n}.{i}'
+def get_nonlocals(blocks: Dict[str, BasicBlock]) -> Set[str]:
+    # The variables that some block reads before assigning them. Only these
+    # can need a phi (semi-pruned SSA).
+    nonlocals = set()
+    for block in blocks.values():
+        var_kill = set()
+        for instr in block.instrs:
+            for arg in instr.get('args', []):
+                if arg not in var_kill:
+                    nonlocals.add(arg)
+            if 'dest' in instr:
+                var_kill.add(instr['dest'])
+    return nonlocals
+
+
+# The phi operand for a path on which the variable is never assigned, as in
+# examples/to_ssa.py.
+UNDEFINED = '__undefined'
+
+
+def insert_phi_functions(globals, definitions, dominators, blocks: Dict[str, BasicBlock],
+                         live_in: Optional[Dict[str, Set[str]]] = None,
+                         types: Optional[Dict[str, object]] = None) -> None:
+    # With live_in (the variables live into each block), only live variables
+    # get phis (pruned SSA). types gives each variable's type (int if not).
+    labels = dominators.names
+    index = dominators.index
+    # The phis to add to the front of each block.
+    new_phis: List[List[dict]] = [[] for _ in labels]
+    # In a fixed order, so the phis come out the same every run.
+    for var in sorted(globals):
+        # Variables that are never assigned (only arguments) need no phis.
+        def_blocks = [index[label] for label in definitions.get(var, ())]
+        for block in dominators.dominance.iterated_frontier(def_blocks):
+            if live_in is not None and var not in live_in[labels[block]]:
+                continue
+            # One operand for each predecessor, in order; renaming fills in
+            # the ones on paths that assign the variable.
+            preds = list(blocks[labels[block]].predecessors)
+            new_phis[block].append({
+                'op': 'phi',
+                'dest': var,
+                'type': types.get(var, 'int') if types else 'int',
+                'labels': preds,
+                'args': [UNDEFINED] * len(preds)
+            })
+
+    # The phis go right after each block's label.
+    for block, added in enumerate(new_phis):
+        if added:
+            blocks[labels[block]].instrs[1:1] = added
+
+
+def rename_ssa(blocks: Dict[str, BasicBlock], globals_: Set[str], dom_tree: Dict[str, List[str]],
+               params: Tuple[str, ...] = ()):
+    # Variables are numbered, and each has a stack of its names in scope,
+    # the newest last. A name is only built when a variable is assigned;
+    # uses take it from the top of the stack. The function's params are in
+    # scope from the start, under their own names.
+    names = list(globals_)
+    ids = {name: var for var, name in enumerate(names)}
+    counter = [1] * len(names)
+    stack: List[List[str]] = [[] for _ in names]
+    for param in params:
+        if param in ids:
+            stack[ids[param]].append(param)
+    # The phis at the top of each block with their variables, taken before
+    # renaming, and where each predecessor's operand goes in them.
+    phis = {}
+    slots = {}
+    for label, block in blocks.items():
+        phis[label] = block_phis = []
+        for instr in block.instrs:
+            if 'op' in instr:
+                if instr['op'] != 'phi':
+                    break
+                block_phis.append((instr, ids[instr['dest']]))
+        if block_phis:
+            slots[label] = {pred: i for i, pred in enumerate(block.predecessors)}
+    # The variables each block on the current path pushed a name for.
+    pushed: List[List[int]] = []
+
+    def newname(var: int) -> str:
+        i = counter[var]
+        counter[var] = i + 1
+        name = f'{names[var]}.{i}'
+        stack[var].append(name)
+        return name
 
     def rename_block(block: BasicBlock):
-        for instr in block.instrs:
-            if 'op' in instr and instr['op'] == 'phi':
-                dest = instr['dest'].split('.')[0]
-                instr['dest'] = newname(dest)
+        defined = []
+        for instr, var in phis[block.label]:
+            instr['dest'] = newname(var)
+            defined.append(var)
 
         for instr in block.instrs:
-            if 'op' in instr and instr['op'] == 'phi':
+            if 'op' not in instr or instr['op'] == 'phi':
                 continue
 
             if 'args' in instr:
-                for i, arg in enumerate(instr['args']):
-                    a = arg.split('.')[0]
-                    if a not in globals_:
-                        break
-                    instr['args'][i] = f'{a}.{stack[a][0]}'
+                args = instr['args']
+                for i, arg in enumerate(args):
+                    var = ids.get(arg)
+                    if var is not None and stack[var]:
+                        args[i] = stack[var][-1]
 
             if 'dest' in instr:
-                dest = instr['dest'].split('.')[0]
-                instr['dest'] = newname(dest)
-
-
-
-        for successor_label in dom_tree[block.label]:
-            successor = blocks[successor_label]
-
-            for instr in successor.instrs:
-                if 'op' in instr and instr['op'] == 'phi':
-                    for i, arg in enumerate(instr['args']):
-                        a = arg.split('.')[0]
-                        instr['args'][i] = f'{a}.{stack[a][0]}'
-                    dest = instr['dest'].split('.')[0]
-                    instr['dest'] = f'{dest}.{stack[dest][0]}'
+                var = ids[instr['dest']]
+                instr['dest'] = newname(var)
+                defined.append(var)
+        pushed.append(defined)
 
+        # Fill in this block's operand of the phis in its successors.
         for successor_label in block.successors:
-            successor = blocks[successor_label]
-            rename_block(successor)
-
+            if not phis[successor_label]:
+                continue
+            i = slots[successor_label][block.label]
+            for instr, var in phis[successor_label]:
+                if stack[var]:
+                    instr['args'][i] = stack[var][-1]
 
-        for instr in block.instrs:
-            if 'op' in instr and instr['op'] == 'phi':
-                dest = instr['dest'].split('.')[0]
-                stack[dest].pop(0)
+    def pop_block(block: BasicBlock):
+        for var in pushed.pop():
+            stack[var].pop()
 
-            if 'dest' in instr:
-                dest = instr['dest'].split('.')[0]
-                stack[dest].pop(0)
+    # The entry block is the first block. Rename down the dominator tree,
+    # with an explicit stack (deep CFGs would hit the recursion limit), and
+    # pop each block's names on the way back up.
+    walk_tree(next(iter(blocks.values())),
+              lambda block: [blocks[label] for label in dom_tree[block.label]],
+              rename_block, pop_block)
 
-    for n in globals_:
-        counter[n] = 1
-        stack[n] = []
 
-    # for simplicity, we assume that the entry block is the first block
-    rename_block(blocks['entry'])
 
+# Which phis to insert: 'minimal', 'semi-pruned' (only for variables that
+# live across blocks), or 'pruned' (only where the variable is live).
+MODES = ('minimal', 'semi-pruned', 'pruned')
 
 
-def main(program: dict) -> dict:
-    blocks = program_to_basic_blocks(program)
+def func_to_ssa(function: dict, mode='minimal') -> None:
+    if not function.get('instrs'):
+        return
+    graph = CFG(function['instrs'])
+    # Phis in the entry block would have no operand for the function's
+    # arguments, so it must have no predecessors.
+    graph.add_entry()
+    blocks = cfg_to_basic_blocks(graph)
     dominators = get_dominators(blocks)
-    dominance_frontier = get_dominance_frontier(dominators, blocks)
     globals_, definitions = get_globals(blocks)
-    insert_phi_functions(globals_, definitions, dominance_frontier, blocks)
+    phi_vars = globals_
+    live_in = None
+    if mode == 'semi-pruned':
+        phi_vars = globals_ & get_nonlocals(blocks)
+    elif mode == 'pruned':
+        live_in, _ = live_variables(blocks)
+    types = {arg['name']: arg['type'] for arg in function.get('args', [])}
+    for block in blocks.values():
+        for instr in block.instrs:
+            if 'dest' in instr:
+                types[instr['dest']] = instr['type']
+    insert_phi_functions(phi_vars, definitions, dominators, blocks, live_in,
+                         types)
     dom_tree = get_dominance_tree(dominators)
-    rename_ssa(blocks, globals_, dom_tree)
+    rename_ssa(blocks, globals_, dom_tree,
+               tuple(arg['name'] for arg in function.get('args', [])))
+
+    # Put the blocks, with their phis, back into the function.
+    for name, block in blocks.items():
+        graph[name].instrs = block.instrs[1:]
+    function['instrs'] = graph.reassemble()
+
+
+def main(program: dict, mode='minimal') -> dict:
+    if mode not in MODES:
+        raise ValueError('unknown SSA mode: {}'.format(mode))
+    for function in program['functions']:
+        func_to_ssa(function, mode)
     return program
 
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        with open(sys.argv[1], 'r') as f:
+    mode = 'minimal'
+    if '--pruned' in sys.argv:
+        mode = 'pruned'
+    elif '--semi-pruned' in sys.argv:
+        mode = 'semi-pruned'
+    files = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if files:
+        with open(files[0], 'r') as f:
             program = json.load(f)
     else:
         program = sys.stdin.read()
         program = json.loads(program)
 
-    program = main(program)
+    program = main(program, mode)
     print(json.dumps(program))
\ No newline at end of file